@@ -1,17 +1,28 @@
 import os
+import json
+import base64
+import hmac
+import threading
+import time
+import asyncio
+import contextvars
+from typing import List
 import torch
 import numpy as np
-import matplotlib.pyplot as plt
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, Depends
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image
-import io
-import base64
-from core.model import load_model
+from core.cache import ResultCache, hash_bytes
+from core.executor import BoundedExecutor, Overloaded
+from core.render import overlay_heatmap, encode_image, image_format
+from core.startup import StartupTracker, NotReady
+from core.preprocess import Preprocessor, normalize, decode_image, resize_center_crop
+from core.metrics import (REGISTRY, REQUESTS, REQUEST_SECONDS, ERRORS, start_request, current_request, stage,
+                          count_error, log_request, logger)
+from core import config
+from core.registry import ModelRegistry
+from core.jobs import JobStore, JobQueue
 from core.xai import XAIManager, _HAS_SHAP, _HAS_LIME
-from utils import load_image
-from captum.attr import visualization as viz
 
 app = FastAPI()
 
@@ -24,230 +35,775 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load model
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
-model = load_model(num_classes=12, device=device)
-
-# Load trained model weights
-model_path = 'models/brain_tumor_model.pth'
-if os.path.exists(model_path):
-    model.load_state_dict(torch.load(model_path, map_location=device))
-    print(f"Loaded trained model from {model_path}")
-else:
-    print(f"Warning: Model file {model_path} not found, using untrained model")
-
-model.eval()
-xai_manager = XAIManager(model, device)
-
-# Load classes
-classes = ['carcinoma', 'ependimoma', 'ganglioglioma', 'germinoma', 'glioma', 'granuloma', 'medulloblastoma', 'meningioma', 'normal', 'pituitary', 'schwannoma', 'tuberculoma']
-
-def tensor_to_base64_image(fig):
-    """Convert matplotlib figure to base64 string"""
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-    buf.seek(0)
-    img_base64 = base64.b64encode(buf.getvalue()).decode()
-    buf.close()
-    plt.close(fig)
-    return img_base64
+model_path = config.MODEL_PATH
+startup = StartupTracker()
+preprocessor = Preprocessor()
+
+# CPU-bound work runs off the event loop: cheap predictions and expensive
+# explanations get separate bounded pools so a slow LIME can't starve /predict
+predict_executor = BoundedExecutor("predict", config.PREDICT_WORKERS, config.PREDICT_QUEUE)
+explain_executor = BoundedExecutor("explain", config.EXPLAIN_WORKERS, config.EXPLAIN_QUEUE)
+result_cache = ResultCache(max_bytes=config.CACHE_MAX_MB * 1024 * 1024)
+# Decoding pool for multi-file uploads (PIL releases the GIL while decoding)
+decode_executor = BoundedExecutor("decode", config.DECODE_WORKERS, config.DECODE_QUEUE)
+
+# Named model versions; load_models() registers the startup one (config.MODEL_VERSION)
+registry = ModelRegistry(device, predict_executor)
+
+def load_models():
+    """Build, load, optimize and warm up the startup model version; records per-phase timings"""
+    if not startup.begin():
+        return
+    try:
+        version = registry.build(config.MODEL_VERSION, model_path, phase=startup.phase)
+        registry.register(version, activate=True)
+        startup.mark_ready()
+        print(f"Startup finished: {startup.phases}")
+    except Exception as e:
+        startup.error = str(e)
+        print(f"ERROR during startup: {e}")
+        raise
+
+# Set by start_job_queue() once the model is ready
+job_queue = None
+
+def start_job_queue():
+    """Open the job store and start its workers in this process (after the fork under core.serve)"""
+    global job_queue
+    if job_queue is None:
+        store = JobStore(config.JOB_DIR, ttl_seconds=config.JOB_TTL_SECONDS)
+        job_queue = JobQueue(store, run_explanation_job, workers=config.JOB_WORKERS, max_queue=config.JOB_MAX_QUEUE)
+        job_queue.start()
+
+def load_models_and_jobs():
+    load_models()
+    start_job_queue()
+
+@app.on_event("startup")
+async def start_model_loading():
+    if not startup.started:
+        if config.BACKGROUND_STARTUP:
+            # /health answers (not ready) while the model loads
+            threading.Thread(target=load_models_and_jobs, name="model-loader", daemon=True).start()
+            return
+        load_models()
+    if startup.ready:
+        start_job_queue()
 
 def process_image(file_bytes, filename: str = ""):
-    """Process uploaded image"""
-    # Load image from bytes
-    image = Image.open(io.BytesIO(file_bytes)).convert('RGB')
-    
-    # Simple preprocessing
-    image = image.resize((224, 224))
-    img_array = np.array(image)
-    img_tensor = torch.from_numpy(img_array).permute(2, 0, 1).float() / 255.0
-    
-    # Normalize
-    mean = torch.tensor([0.485, 0.456, 0.406]).view(3, 1, 1)
-    std = torch.tensor([0.229, 0.224, 0.225]).view(3, 1, 1)
-    img_tensor = (img_tensor - mean) / std
-    
-    # Add batch dimension and move to device
-    img_tensor = img_tensor.unsqueeze(0).to(device)
-    return img_tensor, image
+    """Process uploaded image -> ([1, 3, 224, 224] tensor on device, cropped PIL image)"""
+    with stage("decode"):
+        image = decode_image(file_bytes, preprocessor.resize)
+    with stage("preprocess"):
+        image = resize_center_crop(image, preprocessor.resize, preprocessor.crop)
+        # A fresh tensor, not a reused `out` buffer: it outlives this call in the result cache and the batcher queue
+        img_tensor = normalize(np.asarray(image)[None])
+    return img_tensor.to(device), image
+
+def format_prediction(probabilities, version):
+    """Build the predict response from one row of softmax probabilities"""
+    classes = version.class_names
+    predicted_class_idx = probabilities.argmax().item()
+    confidence = probabilities[predicted_class_idx].item()
+
+    # Get probability distribution
+    prob_dist = {}
+    for i, class_name in enumerate(classes):
+        prob_dist[class_name] = round(probabilities[i].item() * 100, 1)
+
+    return {
+        "predicted_class": classes[predicted_class_idx],
+        "confidence": round(confidence, 3),  # Возвращаем от 0 до 1, фронт сам умножит на 100
+        "probability_distribution": prob_dist,
+        "model_version": version.name
+    }
+
+async def cached_preprocess(digest, contents, filename=""):
+    """Preprocessed tensor and resized image for an upload, shared across endpoints"""
+    async def compute():
+        return await predict_executor.run(process_image, contents, filename)
+    return await result_cache.get_or_compute((digest, "preprocess"), compute)
+
+async def cached_probabilities(digest, img_tensor, version):
+    """Softmax row for an upload, computed through the version's micro-batcher on a miss"""
+    async def compute():
+        # Includes the micro-batching wait; the batch shares one forward pass
+        with stage("forward"):
+            return await version.batcher.submit(img_tensor)
+    return await result_cache.get_or_compute((digest, version.key, "probabilities"), compute)
+
+def model_version(request: Request):
+    """Version for this request: X-Model-Version header or ?model_version=, else the active one.
+
+    Resolved once, so a swap during the request doesn't change the model it uses.
+    """
+    startup.require_ready()
+    name = request.headers.get("x-model-version") or request.query_params.get("model_version")
+    try:
+        return registry.get(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown model version: {name}")
+
+def require_admin(request: Request):
+    """Admin endpoints are disabled unless ADMIN_TOKEN is set, then need it in X-Admin-Token"""
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (set ADMIN_TOKEN)")
+    token = request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode(), config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+async def label_request(request: Request):
+    """Record this request's timings under its route template (/api/jobs/{job_id}), not the raw path"""
+    timer = current_request()
+    if timer is not None:
+        timer.endpoint = request.scope["route"].path
+
+# Declared before any route, so every route runs it ahead of its endpoint's stages
+app.router.dependencies.append(Depends(label_request))
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """Per-request stage timer -> Server-Timing header, latency metrics and sampled request log"""
+    # Unmatched paths stay "other"; label_request renames the rest once routing has matched
+    timer = start_request("other")
+    try:
+        response = await call_next(request)
+    except Exception:
+        ERRORS.inc(timer.endpoint, "exception")
+        log_request(timer, 500, config.LOG_SAMPLE_RATE)
+        raise
+    route = request.scope.get("route")
+    if route is not None:
+        # Also labels requests that matched a path but not a method (405)
+        timer.endpoint = route.path
+    status = response.status_code
+    # Headers go out before a streamed body (/api/predict/batch, /api/explain/stream), so there
+    # Server-Timing only covers the stages up to the first byte; latency and logs cover the whole body
+    response.headers["Server-Timing"] = timer.server_timing()
+    body = response.body_iterator
+
+    async def record_after_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            if status >= 400 and status != 503:  # 503s are counted by their handlers
+                ERRORS.inc(timer.endpoint, "server_error" if status >= 500 else "client_error")
+            REQUESTS.inc(timer.endpoint, str(status))
+            REQUEST_SECONDS.observe(time.perf_counter() - timer.started, timer.endpoint, str(status))
+            log_request(timer, status, config.LOG_SAMPLE_RATE)
+
+    response.body_iterator = record_after_body()
+    return response
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of stage/request latencies, errors and fallbacks"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.exception_handler(NotReady)
+async def not_ready_handler(request, exc: NotReady):
+    count_error("not_ready")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc: Overloaded):
+    count_error(f"overloaded_{exc.pool_name}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+def active_model_status():
+    """Backend, classes and batching stats of the active version (top-level /health fields)"""
+    try:
+        version = registry.get()
+    except KeyError:
+        return {"model_path": model_path, "model_version": None}
+    status = version.status()
+    return {
+        "model_version": version.name,
+        "model_backend": status["backend"],
+        "eager_optimizations": status["eager_optimizations"],
+        "model_path": version.checkpoint_path,
+        "num_classes": status["num_classes"],
+        "classes": status["classes"],
+        "predict_batching": status["predict_batching"],
+    }
 
 @app.get("/health")
 async def health_check():
     return {
         "status": "running",
+        "ready": startup.ready,
+        "startup": startup.status(),
         "device": device,
-        "model_loaded": True,
-        "model_path": "models/brain_tumor_model.pth",
-        "num_classes": len(classes),
-        "classes": classes,
+        "model_loaded": startup.ready,
+        **active_model_status(),
+        "models": registry.status(),
         "shap_available": _HAS_SHAP,
-        "lime_available": _HAS_LIME
+        "lime_available": _HAS_LIME,
+        "cache": result_cache.stats(),
+        "jobs": job_queue.store.stats() if job_queue else None,
+        "executors": {
+            "predict": predict_executor.stats(),
+            "explain": explain_executor.stats(),
+            "decode": decode_executor.stats()
+        }
     }
 
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 200 once the model is loaded and warmed up, 503 before"""
+    if not startup.ready:
+        return JSONResponse(status_code=503, content=startup.status())
+    return startup.status()
+
 @app.post("/api/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(file: UploadFile = File(...), version=Depends(model_version)):
     try:
-        print(f"Processing file: {file.filename}")
-        contents = await file.read()
-        print(f"File size: {len(contents)} bytes")
-        
-        img_tensor, original_image = process_image(contents, file.filename)
-        print(f"Image tensor shape: {img_tensor.shape}")
-        
-        with torch.no_grad():
-            output = model(img_tensor)
-            print(f"Model output shape: {output.shape}")
-            probabilities = torch.softmax(output, dim=1)
-            predicted_class_idx = output.argmax(dim=1).item()
-            confidence = probabilities[0][predicted_class_idx].item()
-        
-        predicted_class = classes[predicted_class_idx]
-        print(f"Predicted: {predicted_class} (confidence: {confidence:.3f})")
-        print(f"Confidence before *100: {confidence}")
-        print(f"Confidence after *100: {confidence * 100}")
-        
-        # Get probability distribution
-        prob_dist = {}
-        for i, class_name in enumerate(classes):
-            prob_dist[class_name] = round(probabilities[0][i].item() * 100, 1)
-        
-        return {
-            "predicted_class": predicted_class,
-            "confidence": round(confidence, 3),  # Возвращаем от 0 до 1, фронт сам умножит на 100
-            "probability_distribution": prob_dist
-        }
-        
+        with stage("upload_read"):
+            contents = await file.read()
+
+        digest = hash_bytes(contents)
+        img_tensor, original_image = await cached_preprocess(digest, contents, file.filename)
+
+        # Batched together with other concurrent requests
+        probabilities = await cached_probabilities(digest, img_tensor, version)
+        with stage("serialize"):
+            return format_prediction(probabilities, version)
+
+    except (Overloaded, NotReady):
+        raise
     except Exception as e:
-        print(f"ERROR in predict: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"predict failed for {file.filename!r}")
         return JSONResponse(
             status_code=500,
             content={"detail": f"Prediction error: {str(e)}"}
         )
 
+async def run_admitted(executor, fn, *args):
+    """executor.run() that waits while the pool is overloaded instead of raising (for streams already started)"""
+    while True:
+        try:
+            return await executor.run(fn, *args)
+        except Overloaded as e:
+            await asyncio.sleep(e.retry_after)
+
+async def _stream_batch_predictions(files, version):
+    """Read and decode uploads a window at a time and yield NDJSON results chunk by chunk
+
+    Only the files in the window are held in memory (the multipart parser
+    spools the rest to disk). The 200 is sent with the first line, so a full
+    decode or predict pool is waited out rather than turned into errors.
+    """
+    async def decode(index, filename, contents):
+        try:
+            img_tensor, _ = await run_admitted(decode_executor, process_image, contents, filename)
+            return index, filename, img_tensor, None
+        except Exception as e:
+            count_error("decode")
+            return index, filename, None, f"Could not decode image: {e}"
+
+    async def predict(batch):
+        try:
+            with stage("forward"):
+                probabilities = await run_admitted(predict_executor, version.batcher.forward, [item[2] for item in batch])
+        except Exception as e:
+            count_error("forward")
+            return [{"index": index, "filename": filename, "error": f"Prediction error: {e}"} for index, filename, _ in batch]
+        lines = []
+        for row, (index, filename, _) in zip(probabilities, batch):
+            result_cache.put((digests[index], version.key, "probabilities"), row)
+            lines.append({"index": index, "filename": filename, **format_prediction(row, version)})
+        return lines
+
+    uploads = enumerate(files)
+    digests = {}
+    decoding = set()
+    chunk = []
+    try:
+        while True:
+            # Top up the window; files seen before are answered straight from the cache
+            while len(decoding) < config.BATCH_CHUNK_SIZE:
+                index, file = next(uploads, (None, None))
+                if file is None:
+                    break
+                with stage("upload_read"):
+                    contents = await file.read()
+                digest = hash_bytes(contents)
+                probabilities = result_cache.get((digest, version.key, "probabilities"))
+                if probabilities is not None:
+                    yield json.dumps({"index": index, "filename": file.filename, **format_prediction(probabilities, version)}) + "\n"
+                else:
+                    digests[index] = digest
+                    decoding.add(asyncio.ensure_future(decode(index, file.filename, contents)))
+
+            # An empty window after topping up means every file has been read
+            if chunk and (len(chunk) >= config.BATCH_CHUNK_SIZE or not decoding):
+                batch, chunk = chunk, []
+                for line in await predict(batch):
+                    yield json.dumps(line) + "\n"
+            if not decoding:
+                break
+
+            done, decoding = await asyncio.wait(decoding, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, filename, img_tensor, error = task.result()
+                if error is not None:
+                    yield json.dumps({"index": index, "filename": filename, "error": error}) + "\n"
+                else:
+                    chunk.append((index, filename, img_tensor))
+    finally:
+        for task in decoding:
+            task.cancel()
+
+@app.post("/api/predict/batch")
+async def predict_batch(files: List[UploadFile] = File(...), version=Depends(model_version)):
+    """Predict many files in one request, streaming one JSON line per file"""
+    if len(files) > config.BATCH_MAX_FILES:
+        return JSONResponse(
+            status_code=400,
+            content={"detail": f"Too many files: {len(files)} (max {config.BATCH_MAX_FILES})"}
+        )
+    # Files are read inside the stream; FastAPI keeps them open until the response is sent
+    return StreamingResponse(_stream_batch_predictions(files, version), media_type="application/x-ndjson")
+
+EXPLAIN_METHODS = ('gradcam', 'shap', 'lime')
+
+# Colormap and normalization per method
+EXPLAIN_STYLES = {
+    'gradcam': ('jet', False),     # Red = High importance areas
+    'shap': ('hot', False),        # Red = High importance areas
+    'lime': ('RdBu_r', True),      # Red = Positive, Blue = Negative
+}
+
+def attribution_to_heatmap(values):
+    """Turn a [1, C, H, W] attribution tensor into a 2-D map (None passes through)"""
+    if values is None:
+        return None
+    heatmap = values[0].squeeze().cpu().numpy()
+    # Усредняем по каналам
+    if heatmap.ndim == 3:
+        heatmap = heatmap.mean(axis=0)
+    return heatmap
+
+def render_heatmap(method, original_image, heatmap):
+    cmap, symmetric = EXPLAIN_STYLES[method]
+    if heatmap is None:
+        # The XAI method failed; the original image is returned without an overlay
+        count_error(f"xai_{method}")
+    with stage("render", method):
+        array = overlay_heatmap(original_image, heatmap, cmap=cmap, symmetric=symmetric)
+    with stage("encode", method):
+        encoded = encode_image(array, config.EXPLAIN_IMAGE_FORMAT, config.EXPLAIN_IMAGE_SIZE)
+        return base64.b64encode(encoded).decode()
+
+def lime_options(num_samples=None, num_features=None):
+    """Effective LIME parameters, part of the cache key for LIME explanations"""
+    # Cost grows linearly with the samples: cap them like the progressive stream does
+    num_samples = min(num_samples or config.LIME_NUM_SAMPLES, config.LIME_MAX_SAMPLES)
+    return (num_samples, num_features or config.LIME_NUM_FEATURES)
+
+def explain_cache_key(digest, version, method, target_class, options):
+    return (digest, version.key, "explain", method, target_class, options if method == 'lime' else None)
+
+def render_explanation(version, method, img_tensor, original_image, target_class, options=None, image_key=None):
+    """Run one XAI method and render it over the original image -> (base64, target_class, details)"""
+    xai_manager = version.xai_manager
+    details = {}
+    with stage("xai", method):
+        if method == 'gradcam':
+            attributions, target_class = xai_manager.grad_cam(img_tensor, target_class)
+            heatmap = attribution_to_heatmap(attributions)
+        elif method == 'shap':
+            result = xai_manager.analyze(img_tensor, ('shap',), target_class)
+            target_class = result['target_class']
+            heatmap = attribution_to_heatmap(result['maps']['shap'])
+            details = result['details']['shap']
+        elif method == 'lime':
+            num_samples, num_features = options or lime_options()
+            heatmap, target_class, details = xai_manager.lime_explain(
+                img_tensor, target_class, num_samples=num_samples, num_features=num_features, image_key=image_key
+            )
+
+    return render_heatmap(method, original_image, heatmap), target_class, details
+
+def analyze_image(version, img_tensor, original_image, methods, target_class, options=None, image_key=None):
+    """Every requested explanation of `target_class`; gradient maps share one forward pass"""
+    gradient_methods = [m for m in methods if m in XAIManager.GRADIENT_METHODS]
+    result = None
+    if gradient_methods:
+        # One forward (+ backward per gradient method), labelled by the methods it covers
+        with stage("xai", "+".join(gradient_methods)):
+            result = version.xai_manager.analyze(img_tensor, gradient_methods, target_class)
+
+    explanations = {}
+    for method in methods:
+        if method in gradient_methods:
+            img_base64 = render_heatmap(method, original_image, attribution_to_heatmap(result['maps'][method]))
+            explanations[method] = (img_base64, result['details'].get(method, {}))
+        else:
+            img_base64, _, details = render_explanation(
+                version, method, img_tensor, original_image, target_class, options, image_key
+            )
+            explanations[method] = (img_base64, details)
+    return explanations
+
+@app.post("/api/analyze")
+async def analyze(
+    file: UploadFile = File(...),
+    methods: str = Form("gradcam,shap"),
+    predicted_class: str = Form(None),
+    num_samples: int = Form(None),
+    num_features: int = Form(None),
+    version=Depends(model_version)
+):
+    """Predict and explain in one call (replaces /api/predict followed by /api/explain)"""
+    try:
+        method_keys = tuple(dict.fromkeys(m.strip().lower() for m in methods.split(",") if m.strip()))
+        unknown = [m for m in method_keys if m not in EXPLAIN_METHODS]
+        if unknown:
+            return JSONResponse(
+                status_code=400,
+                content={"detail": f"Unknown method: {', '.join(unknown)}"}
+            )
+
+        with stage("upload_read"):
+            contents = await file.read()
+        digest = hash_bytes(contents)
+        img_tensor, original_image = await cached_preprocess(digest, contents, file.filename)
+        # The prediction comes from the serving backend (shared with /api/predict), the maps from the eager model
+        probabilities = await cached_probabilities(digest, img_tensor, version)
+        if predicted_class:
+            target_class = version.class_names.index(predicted_class)
+        else:
+            target_class = probabilities.argmax().item()
+        options = lime_options(num_samples, num_features)
+
+        async def compute():
+            return await explain_executor.run(
+                analyze_image, version, img_tensor, original_image, method_keys, target_class, options, digest
+            )
+        explanations = await result_cache.get_or_compute(
+            (digest, version.key, "analyze", method_keys, target_class, options if "lime" in method_keys else None), compute
+        )
+
+        # Later /api/explain calls for the same file are cache hits
+        for method, (img_base64, details) in explanations.items():
+            result_cache.put(
+                explain_cache_key(digest, version, method, target_class, options), (img_base64, target_class, details)
+            )
+
+        fmt = image_format(config.EXPLAIN_IMAGE_FORMAT)
+        with stage("serialize"):
+            return {
+                **format_prediction(probabilities, version),
+                "explained_class": version.class_names[target_class],
+                "explanations": {
+                    method: {"explanation_image": img_base64, "image_format": fmt, "details": details}
+                    for method, (img_base64, details) in explanations.items()
+                }
+            }
+
+    except (Overloaded, NotReady):
+        raise
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Analysis error: {str(e)}"}
+        )
+
 @app.post("/api/explain")
 async def explain(
     file: UploadFile = File(...),
     method: str = Form("gradcam"),
-    predicted_class: str = Form(None)
+    predicted_class: str = Form(None),
+    num_samples: int = Form(None),
+    num_features: int = Form(None),
+    version=Depends(model_version)
 ):
     try:
-        contents = await file.read()
-        img_tensor, original_image = process_image(contents, file.filename)
-        
-        # Get target class
-        if predicted_class:
-            target_class = classes.index(predicted_class)
-        else:
-            with torch.no_grad():
-                output = model(img_tensor)
-                target_class = output.argmax(dim=1).item()
-        
-        # Generate explanation
-        if method.lower() == 'gradcam':
-            attributions, target_class = xai_manager.grad_cam(img_tensor, target_class)
-            
-            fig, ax = plt.subplots(figsize=(6, 4))
-            
-            if attributions is not None:
-                # Простая визуализация Grad-CAM
-                grad_cam_np = attributions[0].squeeze().cpu().numpy()
-                
-                # Показываем оригинальное изображение
-                ax.imshow(np.array(original_image), alpha=0.8)
-                # Накладываем Grad-CAM
-                im = ax.imshow(grad_cam_np, cmap='jet', alpha=0.6)
-                plt.colorbar(im, ax=ax, shrink=0.8, label='Grad-CAM Value')
-                ax.set_title(f"Grad-CAM: {classes[target_class]}\nRed = High importance areas")
-                ax.axis('off')
-            else:
-                ax.imshow(np.array(original_image))
-                ax.set_title(f"Grad-CAM: {classes[target_class]}\n(Unable to generate heatmap)")
-                ax.axis('off')
-            
-            img_base64 = tensor_to_base64_image(fig)
-            
-        elif method.lower() == 'shap':
-            shap_values, target_class = xai_manager.shap_explain(img_tensor, target_class)
-            
-            fig, ax = plt.subplots(figsize=(6, 4))
-            
-            if shap_values is not None:
-                # Простая визуализация SHAP
-                shap_np = shap_values[0].squeeze().cpu().numpy()
-                
-                # Усредняем по каналам
-                if len(shap_np.shape) == 3:
-                    shap_np = np.mean(shap_np, axis=0)
-                
-                # Показываем оригинальное изображение
-                ax.imshow(np.array(original_image), alpha=0.8)
-                # Накладываем SHAP значения
-                im = ax.imshow(shap_np, cmap='hot', alpha=0.6)
-                plt.colorbar(im, ax=ax, shrink=0.8, label='SHAP Value')
-                ax.set_title(f"SHAP: {classes[target_class]}\nRed = High importance areas")
-                ax.axis('off')
-            else:
-                ax.imshow(np.array(original_image))
-                ax.set_title(f"SHAP: {classes[target_class]}\n(Unable to generate SHAP values)")
-                ax.axis('off')
-            
-            img_base64 = tensor_to_base64_image(fig)
-            
-        elif method.lower() == 'lime':
-            lime_values, target_class = xai_manager.lime_explain(img_tensor, target_class)
-            
-            fig, ax = plt.subplots(figsize=(6, 4))
-            
-            if lime_values is not None:
-                # Показываем оригинальное изображение
-                ax.imshow(np.array(original_image), alpha=0.8)
-                # Накладываем LIME значения
-                im = ax.imshow(lime_values, cmap='RdBu_r', alpha=0.6)
-                
-                # Создаем colorbar с указателем
-                cbar = plt.colorbar(im, ax=ax, shrink=0.8, label='LIME Value')
-                
-                # Добавляем указатель на максимальное значение
-                max_val = np.max(np.abs(lime_values))
-                # Нормализуем позицию указателя (от 0 до 1)
-                norm_pos = (max_val + np.abs(lime_values.min())) / (lime_values.max() - lime_values.min())
-                
-                # Добавляем черную линию на colorbar
-                cbar.ax.axhline(y=norm_pos, color='black', linewidth=2, linestyle='--', alpha=0.8)
-                cbar.ax.text(1.1, norm_pos, f'Max: {max_val:.2f}', 
-                           transform=cbar.ax.get_yaxis_transform(), 
-                           ha='left', va='center', fontsize=8, 
-                           bbox=dict(boxstyle='round,pad=0.3', facecolor='yellow', alpha=0.8))
-                
-                ax.set_title(f"LIME: {classes[target_class]}\nRed = Positive, Blue = Negative")
-                ax.axis('off')
-            else:
-                ax.imshow(np.array(original_image))
-                ax.set_title(f"LIME: {classes[target_class]}\n(Unable to generate LIME explanation)")
-                ax.axis('off')
-            
-            img_base64 = tensor_to_base64_image(fig)
-            
-        else:
+        method_key = method.lower()
+        if method_key not in EXPLAIN_METHODS:
             return JSONResponse(
                 status_code=400,
                 content={"detail": f"Unknown method: {method}"}
             )
+
+        with stage("upload_read"):
+            contents = await file.read()
+        digest = hash_bytes(contents)
+        img_tensor, original_image = await cached_preprocess(digest, contents, file.filename)
+        
+        # Get target class (reuses the forward pass from /api/predict if cached)
+        if predicted_class:
+            target_class = version.class_names.index(predicted_class)
+        else:
+            probabilities = await cached_probabilities(digest, img_tensor, version)
+            target_class = probabilities.argmax().item()
+
+        options = lime_options(num_samples, num_features)
+
+        async def compute():
+            return await explain_executor.run(
+                render_explanation, version, method_key, img_tensor, original_image, target_class, options, digest
+            )
+        img_base64, target_class, details = await result_cache.get_or_compute(
+            explain_cache_key(digest, version, method_key, target_class, options), compute
+        )
         
         return {
             "method": method,
             "explanation_image": img_base64,
-            "predicted_class": classes[target_class],
+            "image_format": image_format(config.EXPLAIN_IMAGE_FORMAT),
+            "predicted_class": version.class_names[target_class],
+            "details": details,
+            "model_version": version.name,
         }
         
+    except (Overloaded, NotReady):
+        raise
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"detail": f"Explanation error: {str(e)}"}
         )
 
+def run_explanation_job(job, contents):
+    """JobQueue handler: the /api/explain response, computed by a job worker"""
+    params = json.loads(job["params"])
+    try:
+        version = registry.get(params["model_version"])
+    except KeyError:
+        raise RuntimeError(f"Model version '{params['model_version']}' is not loaded")
+    options = tuple(params["options"]) if params["options"] else None
+
+    def compute():
+        img_tensor, original_image = process_image(contents)
+        return render_explanation(
+            version, job["method"], img_tensor, original_image, params["target_class"], options, job["upload"]
+        )
+
+    # Jobs take a slot in the explain pool like /api/explain, so its concurrency bound covers them too;
+    # when that pool is full the job waits instead of failing
+    context = contextvars.copy_context()
+    while True:
+        try:
+            future = explain_executor.submit(context.run, compute)
+            break
+        except Overloaded as e:
+            time.sleep(e.retry_after)
+    img_base64, target_class, details = future.result()
+    return {
+        "method": job["method"],
+        "explanation_image": img_base64,
+        "image_format": image_format(config.EXPLAIN_IMAGE_FORMAT),
+        "predicted_class": version.class_names[target_class],
+        "details": details,
+        "model_version": version.name,
+    }
+
+def _job_states():
+    if job_queue is None:
+        return {}
+    stats = job_queue.store.stats()
+    return {(status,): stats[status] for status in ("queued", "running", "done", "failed")}
+
+def _job_oldest():
+    if job_queue is None:
+        return {}
+    stats = job_queue.store.stats()
+    return {("queued",): stats["oldest_queued_age_s"], ("running",): stats["oldest_running_age_s"]}
+
+REGISTRY.gauge("brain_tumor_jobs", "Explanation jobs in the store by state", ("status",), _job_states)
+REGISTRY.gauge("brain_tumor_job_oldest_age_seconds", "Age of the oldest queued / running job", ("status",), _job_oldest)
+
+def require_jobs():
+    if job_queue is None:
+        raise NotReady()
+    return job_queue
+
+def job_response(job):
+    response = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "method": job["method"],
+        "priority": job["priority"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "expires_at": job["expires_at"],
+    }
+    if job["status"] == "done":
+        response["result"] = job_queue.store.result(job["id"])
+    elif job["status"] == "failed":
+        response["error"] = job["error"]
+    return response
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    method: str = Form("shap"),
+    predicted_class: str = Form(None),
+    num_samples: int = Form(None),
+    num_features: int = Form(None),
+    priority: int = Form(0),
+    version=Depends(model_version),
+    queue=Depends(require_jobs)
+):
+    """Queue an explanation and return its id at once (higher priority runs first);
+    fetch the result with GET /api/jobs/{job_id}?wait=30"""
+    method_key = method.lower()
+    if method_key not in EXPLAIN_METHODS:
+        return JSONResponse(status_code=400, content={"detail": f"Unknown method: {method}"})
+    if predicted_class and predicted_class not in version.class_names:
+        return JSONResponse(status_code=400, content={"detail": f"Unknown class: {predicted_class}"})
+    if queue.full():
+        raise Overloaded("jobs", retry_after=30)
+
+    with stage("upload_read"):
+        contents = await file.read()
+    params = {
+        "model_version": version.name,
+        "target_class": version.class_names.index(predicted_class) if predicted_class else None,
+        "options": lime_options(num_samples, num_features) if method_key == "lime" else None,
+    }
+    job_id = await asyncio.to_thread(queue.submit, hash_bytes(contents), contents, method_key, params, priority)
+    return {"job_id": job_id, "status": "queued", "status_url": f"/api/jobs/{job_id}"}
+
+@app.get("/api/jobs")
+async def job_stats(queue=Depends(require_jobs)):
+    """Queue depth by state and priority and the age of the oldest waiting / running job"""
+    return {**queue.store.stats(), "workers": queue.workers, "max_queue": queue.max_queue}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0, queue=Depends(require_jobs)):
+    """Job state, with the result once done; wait > 0 long-polls up to that many seconds (max JOB_MAX_WAIT)"""
+    wait = min(max(wait, 0.0), config.JOB_MAX_WAIT)
+    job = await queue.wait(job_id, wait) if wait else queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+    return job_response(job)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _stream_lime_rounds(rounds, original_image, version):
+    """One SSE event per LIME round; each round takes an explain-pool slot of its own"""
+    def step():
+        with stage("xai", "lime"):
+            heatmap, target_class, info = next(rounds)
+        return render_heatmap('lime', original_image, heatmap), target_class, info
+
+    fmt = image_format(config.EXPLAIN_IMAGE_FORMAT)
+    try:
+        while True:
+            img_base64, target_class, info = await explain_executor.run(step)
+            yield sse_event("done" if info["done"] else "round", {
+                **info,
+                "method": "lime",
+                "explanation_image": img_base64,
+                "image_format": fmt,
+                "predicted_class": version.class_names[target_class],
+                "model_version": version.name,
+            })
+            if info["done"]:
+                break
+    except Overloaded as e:
+        yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+    except Exception as e:
+        count_error("xai_lime")
+        logger.exception("streaming LIME failed")
+        yield sse_event("error", {"detail": f"Explanation error: {str(e)}"})
+
+@app.post("/api/explain/stream")
+async def explain_stream(
+    file: UploadFile = File(...),
+    predicted_class: str = Form(None),
+    num_features: int = Form(None),
+    round_samples: int = Form(None),
+    max_samples: int = Form(None),
+    version=Depends(model_version)
+):
+    """LIME as Server-Sent Events: a coarse map after the first round of perturbations,
+    refined each round until the top-superpixel ranking stops changing (event "done")"""
+    try:
+        with stage("upload_read"):
+            contents = await file.read()
+        digest = hash_bytes(contents)
+        img_tensor, original_image = await cached_preprocess(digest, contents, file.filename)
+        target_class = version.class_names.index(predicted_class) if predicted_class else None
+    except (Overloaded, NotReady):
+        raise
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Explanation error: {str(e)}"}
+        )
+
+    rounds = version.xai_manager.lime_progressive(
+        img_tensor, target_class, num_features=num_features, round_samples=round_samples,
+        max_samples=max_samples, image_key=digest
+    )
+    return StreamingResponse(
+        _stream_lime_rounds(rounds, original_image, version),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/models")
+async def list_models():
+    """Registered versions, the active one and any still loading"""
+    return registry.status()
+
+@app.post("/api/models", status_code=202, dependencies=[Depends(require_admin)])
+async def add_model(
+    name: str = Form(...),
+    checkpoint: str = Form(...),
+    class_mapping: str = Form(None),
+    backend: str = Form(None),
+    activate: bool = Form(False)
+):
+    """Load a checkpoint as version `name` in the background; with activate it becomes the default once warm.
+
+    Re-using an existing name replaces that version when the new build is ready.
+    """
+    if not os.path.exists(checkpoint):
+        raise HTTPException(status_code=400, detail=f"Checkpoint not found: {checkpoint}")
+    if class_mapping and not os.path.exists(class_mapping):
+        raise HTTPException(status_code=400, detail=f"Class mapping not found: {class_mapping}")
+    try:
+        registry.load_async(name, checkpoint, backend, class_mapping, activate=activate)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"name": name, "state": "loading", "activate": activate}
+
+@app.post("/api/models/{name}/activate", dependencies=[Depends(require_admin)])
+async def activate_model(name: str):
+    """Make `name` the default for requests without X-Model-Version"""
+    try:
+        registry.activate(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown model version: {name}")
+    return {"default": name}
+
+@app.delete("/api/models/{name}", dependencies=[Depends(require_admin)])
+async def remove_model(name: str):
+    try:
+        registry.remove(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown model version: {name}")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"removed": name}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
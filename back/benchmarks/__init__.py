@@ -0,0 +1 @@
+# Benchmarks for the serving, XAI and training hot paths
@@ -0,0 +1,111 @@
+"""Compare per-image torchvision augmentation with core.augment.BatchAugment.
+
+Reports images/sec for both paths and a two-sample Kolmogorov-Smirnov test
+on per-sample statistics of the augmented outputs (mean, contrast,
+left/right and top/bottom balance, zero-filled corner), so a change to the
+batch path that shifts the augmentation distribution shows up as a low
+p-value.
+
+Usage (from back/):
+    python -m benchmarks.bench_augment --images 256 --batch 32 --samples 1000
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+from scipy.stats import ks_2samp
+
+from core.augment import BatchAugment, ToUint8Tensor
+from core.train import build_transforms
+
+
+def synthetic_image(size=256, seed=0):
+    """Asymmetric test image: gradient, an off-center bright disk and some texture"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size] / size
+    base = 0.25 + 0.5 * xx * (1 - 0.4 * yy)
+    disk = ((xx - 0.65) ** 2 + (yy - 0.35) ** 2) < 0.02
+    image = np.stack([base, base * 0.9, base * 0.8], axis=-1)
+    image[disk] = (0.95, 0.9, 0.7)
+    image += rng.normal(scale=0.03, size=image.shape)
+    return Image.fromarray((np.clip(image, 0, 1) * 255).astype(np.uint8))
+
+
+def per_image(images, transform):
+    return torch.stack([transform(image) for image in images])
+
+
+def batched(images, to_tensor, augment, batch_size):
+    outputs = []
+    for start in range(0, len(images), batch_size):
+        batch = torch.stack([to_tensor(image) for image in images[start:start + batch_size]])
+        outputs.append(augment(batch))
+    return torch.cat(outputs)
+
+
+def throughput(fn, count, repeat):
+    fn()  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return count * repeat / (time.perf_counter() - started)
+
+
+def statistics(outputs):
+    """Per-sample summary statistics of normalized [N, 3, H, W] outputs"""
+    width = outputs.shape[-1]
+    gray = outputs.mean(dim=1)
+    return {
+        'mean': gray.mean(dim=(1, 2)),
+        'std': gray.std(dim=(1, 2)),
+        'left_right': gray[:, :, :width // 2].mean(dim=(1, 2)) - gray[:, :, width // 2:].mean(dim=(1, 2)),
+        'top_bottom': gray[:, :width // 2].mean(dim=(1, 2)) - gray[:, width // 2:].mean(dim=(1, 2)),
+        'corner': gray[:, :8, :8].mean(dim=(1, 2)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=256, help='Images per throughput run')
+    parser.add_argument('--batch', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--samples', type=int, default=1000, help='Augmented samples per distribution check')
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+
+    train_transform, _ = build_transforms()
+    to_tensor = ToUint8Tensor()
+    augment = BatchAugment()
+
+    # Throughput on varied source sizes (workers still resize/crop to 256 in the batch path)
+    rng = np.random.default_rng(1)
+    images = [Image.fromarray(rng.integers(0, 255, (int(h), int(w), 3), dtype=np.uint8))
+              for h, w in rng.integers(256, 512, size=(args.images, 2))]
+    print(f"torch threads: {torch.get_num_threads()}")
+    per_image_ips = throughput(lambda: per_image(images, train_transform), len(images), args.repeat)
+    batched_ips = throughput(lambda: batched(images, to_tensor, augment, args.batch), len(images), args.repeat)
+    augment_only = torch.stack([to_tensor(image) for image in images[:args.batch]])
+    augment_ips = throughput(lambda: augment(augment_only), args.batch, args.repeat * 4)
+    print(f"per-image torchvision : {per_image_ips:8.1f} img/s")
+    print(f"batched (incl. resize): {batched_ips:8.1f} img/s  ({batched_ips / per_image_ips:.2f}x)")
+    print(f"batched augment only  : {augment_ips:8.1f} img/s")
+
+    # Distribution check: the same 256x256 source augmented many times by each path
+    source = synthetic_image()
+    reference = statistics(per_image([source] * args.samples, train_transform))
+    candidate = statistics(batched([source] * args.samples, to_tensor, augment, args.batch))
+    print(f"\nKS test over {args.samples} samples per path")
+    print(f"{'statistic':<12} {'ref mean':>9} {'batch mean':>11} {'KS':>6} {'p-value':>8}")
+    for name in reference:
+        result = ks_2samp(reference[name].numpy(), candidate[name].numpy())
+        print(f"{name:<12} {reference[name].mean():9.4f} {candidate[name].mean():11.4f} "
+              f"{result.statistic:6.3f} {result.pvalue:8.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Data-parallel scaling of the training step on one machine (gloo DDP, CPU).
+
+Spawns 1, 2, 4... processes, splits the machine's cores evenly between
+them and times forward/backward/all-reduce/step on synthetic batches with a
+fixed per-rank batch size (weak scaling). Reports global images/sec and
+scaling efficiency against one process.
+
+Usage (from back/):
+    python -m benchmarks.bench_ddp_scaling --world-sizes 1 2 4 --batch 16 --steps 10
+"""
+import argparse
+import json
+import os
+import socket
+import time
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn as nn
+from torch.nn.parallel import DistributedDataParallel
+
+from core.model import BrainTumorModel
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def worker(rank, world_size, port, args, results):
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    torch.set_num_threads(max(1, args.threads // world_size))
+    torch.manual_seed(rank)
+
+    model = DistributedDataParallel(BrainTumorModel(num_classes=12, pretrained=False))
+    optimizer = torch.optim.AdamW(model.parameters(), lr=1e-4)
+    criterion = nn.CrossEntropyLoss()
+    inputs = torch.randn(args.batch, 3, args.size, args.size)
+    labels = torch.randint(0, 12, (args.batch,))
+
+    def step():
+        optimizer.zero_grad(set_to_none=True)
+        criterion(model(inputs), labels).backward()
+        optimizer.step()
+
+    for _ in range(args.warmup):
+        step()
+    dist.barrier()
+    started = time.perf_counter()
+    for _ in range(args.steps):
+        step()
+    dist.barrier()
+    elapsed = time.perf_counter() - started
+    if rank == 0:
+        results[world_size] = args.batch * world_size * args.steps / elapsed
+    dist.destroy_process_group()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--world-sizes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--batch', type=int, default=16, help='Per-rank batch size')
+    parser.add_argument('--size', type=int, default=224)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1, help='Cores shared by all ranks')
+    parser.add_argument('--output', type=str, default=None, help='Write results as JSON here')
+    args = parser.parse_args()
+
+    results = mp.Manager().dict()
+    for world_size in args.world_sizes:
+        mp.spawn(worker, args=(world_size, free_port(), args, results), nprocs=world_size, join=True)
+        base = results.get(args.world_sizes[0])
+        efficiency = results[world_size] / (base * world_size / args.world_sizes[0])
+        print(f"world_size {world_size:3d}: {results[world_size]:8.2f} img/s  "
+              f"(threads/rank {max(1, args.threads // world_size)}, efficiency {efficiency:.0%})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'images_per_sec': dict(results)}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
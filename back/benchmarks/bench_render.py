@@ -0,0 +1,85 @@
+"""Compare the NumPy overlay renderer with the previous matplotlib figure path.
+
+Usage (from back/):
+    python -m benchmarks.bench_render --repeat 20 --threads 4
+"""
+import argparse
+import base64
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from core.render import render_overlay_base64
+
+
+def render_matplotlib(image, heatmap, cmap, label):
+    """The figure-based rendering /api/explain used before core.render"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(6, 4))
+    ax.imshow(np.array(image), alpha=0.8)
+    im = ax.imshow(heatmap, cmap=cmap, alpha=0.6)
+    plt.colorbar(im, ax=ax, shrink=0.8, label=label)
+    ax.set_title(f"{label}: glioma\nRed = High importance areas")
+    ax.axis('off')
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=100, bbox_inches='tight')
+    plt.close(fig)
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+def synthetic_inputs(size=224, seed=0):
+    rng = np.random.default_rng(seed)
+    image = Image.fromarray(rng.integers(0, 255, (size, size, 3), dtype=np.uint8))
+    yy, xx = np.mgrid[0:size, 0:size] / size
+    gradcam = np.exp(-((xx - 0.4) ** 2 + (yy - 0.6) ** 2) / 0.05)
+    shap = np.abs(rng.normal(size=(size, size))) * gradcam
+    lime = np.where(gradcam > 0.5, 1.0, -0.3) * rng.uniform(0.2, 1.0)
+    return image, {'gradcam': (gradcam, 'jet'), 'shap': (shap, 'hot'), 'lime': (lime, 'RdBu_r')}
+
+
+def _time(fn, repeat):
+    fn()  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--format', type=str, default='png', choices=['png', 'webp'])
+    args = parser.parse_args()
+
+    image, maps = synthetic_inputs()
+    print(f"{'method':<10}{'matplotlib ms':>15}{'numpy ms':>12}{'speedup':>10}{'bytes old/new':>22}")
+    for method, (heatmap, cmap) in maps.items():
+        old_ms = _time(lambda: render_matplotlib(image, heatmap, cmap, method), args.repeat)
+        new_ms = _time(lambda: render_overlay_base64(image, heatmap, cmap=cmap, symmetric=method == 'lime',
+                                                     fmt=args.format, size=320), args.repeat)
+        old_len = len(render_matplotlib(image, heatmap, cmap, method))
+        new_len = len(render_overlay_base64(image, heatmap, cmap=cmap, fmt=args.format, size=320))
+        print(f"{method:<10}{old_ms:>15.2f}{new_ms:>12.2f}{old_ms / new_ms:>9.1f}x{old_len:>12}/{new_len}")
+
+    # Thread safety + scaling: the same work from several threads must give identical output
+    heatmap, cmap = maps['gradcam']
+    expected = render_overlay_base64(image, heatmap, cmap=cmap, fmt=args.format)
+    jobs = args.repeat * args.threads
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        results = list(pool.map(lambda _: render_overlay_base64(image, heatmap, cmap=cmap, fmt=args.format),
+                                range(jobs)))
+    elapsed = time.perf_counter() - started
+    assert all(r == expected for r in results), "renderer output differs across threads"
+    print(f"\n{args.threads} threads: {jobs / elapsed:.1f} renders/s, outputs identical")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""Regression benchmarks for the serving and XAI hot paths.
+
+Stages: process_image, model forward at batch 1/8/32, Grad-CAM / SHAP /
+LIME, heatmap rendering + encoding (render_overlay_base64, which replaced
+tensor_to_base64_image) and end-to-end /api/predict and /api/explain through
+an in-process TestClient. Everything runs on synthetic images with random
+weights, so no dataset, checkpoint or network is needed.
+
+Usage (from back/):
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json --threshold 0.25
+    python -m benchmarks.suite --update-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --stages forward_b1 gradcam api_predict
+
+With --baseline the run exits with status 1 when any stage's median is more
+than `threshold` (fractional) slower than in the baseline. Baselines are
+machine-specific. benchmarks/baseline.json is a reference run (its 'meta' records
+the torch version, CPU count and threads). A CI runner of a different size should
+record its own with --update-baseline in a job on the base branch and cache it
+for the comparison on pull requests.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+# The API must start synchronously with random weights: set before core.config is imported
+os.environ.setdefault('MODEL_PATH', 'models/__benchmark_random_weights__.pth')
+os.environ.setdefault('PRETRAINED_FALLBACK', '0')
+os.environ.setdefault('BACKGROUND_STARTUP', '0')
+
+import numpy as np
+import torch
+from PIL import Image
+
+
+def synthetic_jpeg(seed, size=512):
+    """A different brain-scan-sized JPEG per seed (defeats the API result cache)"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size] / size
+    base = np.exp(-((xx - 0.5) ** 2 + (yy - 0.5) ** 2) / 0.08)
+    noise = rng.normal(scale=0.1, size=(size, size))
+    image = (np.clip(base + noise, 0, 1) * 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(np.stack([image] * 3, axis=-1)).save(buf, format='JPEG', quality=90)
+    return buf.getvalue()
+
+
+def measure(fn, repeat, warmup=1):
+    """Per-call wall times in ms; fn receives the iteration index"""
+    for i in range(warmup):
+        fn(-1 - i)
+    times = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        fn(i)
+        times.append((time.perf_counter() - started) * 1000)
+    return {
+        'median_ms': round(statistics.median(times), 3),
+        'p90_ms': round(float(np.percentile(times, 90)), 3),
+        'mean_ms': round(statistics.fmean(times), 3),
+        'repeat': repeat,
+    }
+
+
+def build_stages(repeat, xai_repeat):
+    """name -> (callable(i), repeat); heavy objects are built once here"""
+    import api
+    from core.model import BrainTumorModel
+    from core.render import render_overlay_base64
+    from core.xai import XAIManager
+
+    torch.manual_seed(0)
+    model = BrainTumorModel(num_classes=12, pretrained=False).eval()
+    xai = XAIManager(model, 'cpu')
+    images = [synthetic_jpeg(seed) for seed in range(8)]
+    tensor, original = api.process_image(images[0])
+    batches = {b: torch.randn(b, 3, 224, 224) for b in (1, 8, 32)}
+    heatmap = np.random.default_rng(0).random((224, 224))
+
+    def explain(method):
+        # XAIManager logs and returns None on failure; a benchmark of a failing path is meaningless
+        def run(_):
+            attributions = method(tensor)[0]
+            if attributions is None:
+                raise RuntimeError(f"{method.__name__} failed")
+        return run
+
+    def forward(batch):
+        def run(_):
+            with torch.inference_mode():
+                model(batch)
+        return run
+
+    stages = {
+        'process_image': (lambda i: api.process_image(images[i % len(images)]), repeat),
+        'forward_b1': (forward(batches[1]), repeat),
+        'forward_b8': (forward(batches[8]), max(3, repeat // 2)),
+        'forward_b32': (forward(batches[32]), max(3, repeat // 4)),
+        'gradcam': (explain(xai.grad_cam), xai_repeat),
+        'shap': (explain(xai.shap_explain), xai_repeat),
+        'lime': (explain(xai.lime_explain), xai_repeat),
+        'render_overlay': (lambda i: render_overlay_base64(original, heatmap, cmap='jet'), repeat),
+    }
+
+    # End to end through the app; each call sends a new image so the result cache never hits
+    from fastapi.testclient import TestClient
+    client = TestClient(api.app)
+    client.__enter__()  # runs the startup hook (synchronous load with BACKGROUND_STARTUP=0)
+
+    def post(path, data=None):
+        def run(i):
+            # Warm-up calls get negative indices: keep their seeds apart from the measured ones
+            contents = synthetic_jpeg((20_000_000 if i < 0 else 10_000) + abs(i) * 7 + len(path))
+            response = client.post(path, data=data, files={'file': ('scan.jpg', contents, 'image/jpeg')})
+            response.raise_for_status()
+        return run
+
+    stages['api_predict'] = (post('/api/predict'), repeat)
+    stages['api_explain_gradcam'] = (post('/api/explain', {'method': 'gradcam'}), xai_repeat)
+    return stages, client
+
+
+def compare(results, baseline, threshold):
+    """Rows of (stage, baseline ms, current ms, ratio, regressed)"""
+    rows = []
+    for name, current in results['stages'].items():
+        reference = baseline.get('stages', {}).get(name)
+        if reference is None:
+            rows.append((name, None, current['median_ms'], None, False))
+            continue
+        ratio = current['median_ms'] / reference['median_ms']
+        rows.append((name, reference['median_ms'], current['median_ms'], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--xai-repeat', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--stages', type=str, nargs='*', default=None, help='Run only these stages')
+    parser.add_argument('--output', type=str, default=None, help='Write results as JSON here')
+    parser.add_argument('--baseline', type=str, default=None, help='Compare against this results file')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed slowdown (0.25 = 25%%)')
+    parser.add_argument('--update-baseline', type=str, default=None, help='Write results as the new baseline')
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    stages, client = build_stages(args.repeat, args.xai_repeat)
+    selected = args.stages or list(stages)
+    unknown = set(selected) - set(stages)
+    if unknown:
+        parser.error(f"unknown stages: {sorted(unknown)}; available: {list(stages)}")
+
+    results = {
+        'meta': {
+            'torch': torch.__version__,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'threads': torch.get_num_threads(),
+            'timestamp': time.time(),
+        },
+        'stages': {},
+    }
+    try:
+        for name in selected:
+            fn, repeat = stages[name]
+            results['stages'][name] = measure(fn, repeat)
+            r = results['stages'][name]
+            print(f"{name:<22} median {r['median_ms']:9.2f} ms   p90 {r['p90_ms']:9.2f} ms   (n={r['repeat']})")
+    finally:
+        client.__exit__(None, None, None)
+
+    for path in (args.output, args.update_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.threshold)
+        print(f"\n{'stage':<22}{'baseline ms':>12}{'current ms':>12}{'ratio':>8}")
+        for name, reference, current, ratio, regressed in rows:
+            if ratio is None:
+                print(f"{name:<22}{'-':>12}{current:>12.2f}{'new':>8}")
+            else:
+                flag = '  REGRESSION' if regressed else ''
+                print(f"{name:<22}{reference:>12.2f}{current:>12.2f}{ratio:>8.2f}{flag}")
+        regressions = [row[0] for row in rows if row[4]]
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than baseline by more than {args.threshold:.0%}: "
+                  f"{', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\nNo stage slower than baseline by more than {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Batch-level training augmentation on uint8 tensors.
+
+DataLoader workers only decode and resize/crop each image to a fixed
+256x256 uint8 tensor (`ToUint8Tensor`); `BatchAugment` then applies the
+train-time augmentation to the whole collated batch at once, with
+independent random parameters per sample:
+
+  RandomResizedCrop(224, scale=(0.85, 1.0)) + RandomHorizontalFlip +
+  RandomRotation(5)  ->  one sampling grid per sample, a single
+                         grid_sample call
+  ColorJitter(brightness=0.1, contrast=0.1) -> per-sample factors,
+                         broadcast multiply/blend
+  ToTensor + Normalize -> fused scale and bias
+
+Differences from the per-image torchvision pipeline: the crop is taken from
+the 256 center square instead of the full original image, and brightness is
+always applied before contrast (ColorJitter randomizes the order; the two
+only differ where values clip). Intermediate values are rounded/truncated to
+uint8 levels like PIL does, which keeps the mean brightness unbiased relative
+to the old path. benchmarks/bench_augment.py checks the resulting
+distributions against the torchvision transform.
+"""
+import math
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from core.preprocess import IMAGENET_MEAN, IMAGENET_STD, RESIZE_SIZE, CROP_SIZE, resize_center_crop
+
+# Rec. 601 luma, as torchvision's rgb_to_grayscale
+_GRAY = torch.tensor([0.299, 0.587, 0.114]).view(1, 3, 1, 1)
+
+
+class ToUint8Tensor:
+    """Worker-side transform: PIL image -> [3, size, size] uint8 tensor (resize shorter side + center crop)"""
+
+    def __init__(self, size=RESIZE_SIZE):
+        self.size = size
+
+    def __call__(self, image):
+        if image.size != (self.size, self.size):
+            image = resize_center_crop(image, self.size, self.size)
+        return torch.from_numpy(np.asarray(image, dtype=np.uint8).copy()).permute(2, 0, 1)
+
+
+class BatchAugment:
+    """uint8 [B, 3, H, W] batch -> augmented, normalized float32 [B, 3, size, size]"""
+
+    def __init__(self, size=CROP_SIZE, scale=(0.85, 1.0), ratio=(3 / 4, 4 / 3), degrees=5.0,
+                 flip_p=0.5, brightness=0.1, contrast=0.1, generator=None):
+        self.size = size
+        self.scale = scale
+        self.ratio = ratio
+        self.degrees = degrees
+        self.flip_p = flip_p
+        self.brightness = brightness
+        self.contrast = contrast
+        self.generator = generator
+        mean = torch.tensor(IMAGENET_MEAN).view(1, 3, 1, 1)
+        std = torch.tensor(IMAGENET_STD).view(1, 3, 1, 1)
+        self.norm_scale = 1.0 / (255.0 * std)
+        self.norm_bias = -mean / std
+
+    def _uniform(self, n, low, high, device):
+        return torch.rand(n, generator=self.generator, device=device) * (high - low) + low
+
+    def crop_boxes(self, n, height, width, device='cpu', attempts=10):
+        """Per-sample crop (center_x, center_y, half_w, half_h) in normalized [-1, 1] coordinates.
+
+        Same sampling as RandomResizedCrop.get_params: area fraction and
+        log-uniform aspect ratio, resampled up to `attempts` times when the box
+        does not fit, falling back to the full image.
+        """
+        frac_w = torch.ones(n, device=device)
+        frac_h = torch.ones(n, device=device)
+        pending = torch.ones(n, dtype=torch.bool, device=device)
+        log_ratio = (math.log(self.ratio[0]), math.log(self.ratio[1]))
+        for _ in range(attempts):
+            area = self._uniform(n, *self.scale, device)
+            aspect = torch.exp(self._uniform(n, *log_ratio, device))
+            # Box size in pixels, rounded like torchvision, then as a fraction of the side
+            w = torch.round(torch.sqrt(area * height * width * aspect)) / width
+            h = torch.round(torch.sqrt(area * height * width / aspect)) / height
+            fits = pending & (w <= 1) & (h <= 1) & (w > 0) & (h > 0)
+            frac_w = torch.where(fits, w, frac_w)
+            frac_h = torch.where(fits, h, frac_h)
+            pending &= ~fits
+            if not pending.any():
+                break
+        # Top-left uniformly inside the image
+        left = torch.rand(n, generator=self.generator, device=device) * (1 - frac_w)
+        top = torch.rand(n, generator=self.generator, device=device) * (1 - frac_h)
+        center_x = (left + frac_w / 2) * 2 - 1
+        center_y = (top + frac_h / 2) * 2 - 1
+        return center_x, center_y, frac_w, frac_h
+
+    def sampling_grid(self, n, height, width, device='cpu'):
+        """Per-sample grid_sample coordinates and the mask of output pixels that land inside the crop.
+
+        Output pixel -> rotate -> flip gives a position in the crop box
+        (normalized to [-1, 1]); scaling and shifting that box gives the source
+        position. Pixels rotated out of the box are zero-filled, as
+        RandomRotation does on the already-cropped image.
+        """
+        center_x, center_y, frac_w, frac_h = self.crop_boxes(n, height, width, device)
+        angle = torch.deg2rad(self._uniform(n, -self.degrees, self.degrees, device))
+        flip = torch.where(torch.rand(n, generator=self.generator, device=device) < self.flip_p, -1.0, 1.0)
+        cos, sin = torch.cos(angle), torch.sin(angle)
+        # Output is square, so rotating in normalized coordinates is a rotation in pixels
+        rotation = torch.zeros(n, 2, 3, device=device)
+        rotation[:, 0, 0] = flip * cos
+        rotation[:, 0, 1] = -flip * sin
+        rotation[:, 1, 0] = sin
+        rotation[:, 1, 1] = cos
+        theta = rotation.clone()
+        theta[:, 0] *= frac_w.view(n, 1)
+        theta[:, 1] *= frac_h.view(n, 1)
+        theta[:, 0, 2] = center_x
+        theta[:, 1, 2] = center_y
+        shape = (n, 3, self.size, self.size)
+        grid = F.affine_grid(theta, shape, align_corners=False)
+        inside = None
+        if self.degrees:
+            box = F.affine_grid(rotation, shape, align_corners=False)
+            inside = (box.abs().amax(dim=-1) <= 1).unsqueeze(1)
+        return grid, inside
+
+    def __call__(self, batch):
+        n, _, height, width = batch.shape
+        device = batch.device
+
+        # Stays on the 0..255 scale throughout, like the uint8 PIL images of the old path
+        grid, inside = self.sampling_grid(n, height, width, device)
+        images = F.grid_sample(batch.float(), grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+        if inside is not None:
+            images.mul_(inside)
+        # PIL resampling rounds and each enhance step truncates back to uint8
+        images.round_()
+
+        if self.brightness:
+            factor = self._uniform(n, 1 - self.brightness, 1 + self.brightness, device).view(n, 1, 1, 1)
+            images.mul_(factor).clamp_(0, 255).floor_()
+        if self.contrast:
+            factor = self._uniform(n, 1 - self.contrast, 1 + self.contrast, device).view(n, 1, 1, 1)
+            # Mean of the grayscale image == grayscale of the per-channel means
+            gray_mean = (images.mean(dim=(2, 3), keepdim=True) * _GRAY.to(device)).sum(dim=1, keepdim=True)
+            images.mul_(factor).add_((1 - factor) * gray_mean.round()).clamp_(0, 255).floor_()
+
+        # (x / 255 - mean) / std as one scale and bias
+        return images.mul_(self.norm_scale.to(device)).add_(self.norm_bias.to(device))
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from collections import Counter
+
+import torch
+
+
+class MicroBatcher:
+    """Collects concurrent single-image requests into one batched forward pass.
+
+    Callers `await submit(img_tensor)` with a [1, 3, H, W] tensor and get back
+    their own row of the softmax output. A background task waits for the first
+    request, then keeps collecting until either `max_batch_size` requests are
+    queued or `max_wait_ms` has passed, and runs the model once on the stack.
+    """
+
+    def __init__(self, model, max_batch_size=16, max_wait_ms=5.0, executor=None):
+        self.model = model
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.executor = executor
+        self._queue = None
+        self._worker = None
+        self._loop = None
+
+        # Stats
+        self._requests = 0
+        self._batches = 0
+        self._batch_sizes = Counter()
+        self._forward_time = 0.0
+        self._wait_time = 0.0
+        self._last_batch_ms = 0.0
+
+    async def submit(self, img_tensor):
+        """Queue one preprocessed image and wait for its probability row"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((img_tensor, future, time.perf_counter()))
+        return await future
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Queue and worker are bound to the loop they were created on
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = None
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without waiting
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            tensors = [item[0] for item in batch]
+            futures = [item[1] for item in batch]
+            started = time.perf_counter()
+            try:
+                probabilities = await loop.run_in_executor(self.executor, self.forward, tensors)
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+
+            for i, future in enumerate(futures):
+                if not future.done():
+                    future.set_result(probabilities[i])
+
+            self._requests += len(batch)
+            self._batches += 1
+            self._batch_sizes[len(batch)] += 1
+            self._forward_time += finished - started
+            self._wait_time += sum(started - item[2] for item in batch)
+            self._last_batch_ms = (finished - started) * 1000
+
+    def forward(self, tensors):
+        """Run the model once on a list of [1, 3, H, W] tensors and return softmax rows"""
+        batch = torch.cat(tensors, dim=0)
+        with torch.inference_mode():
+            output = self.model(batch)
+            return torch.softmax(output, dim=1).cpu()
+
+    def stats(self):
+        """Queue depth and batch-size statistics for tuning latency vs throughput"""
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'requests': self._requests,
+            'batches': self._batches,
+            'avg_batch_size': round(self._requests / self._batches, 2) if self._batches else 0.0,
+            'batch_size_histogram': {str(k): v for k, v in sorted(self._batch_sizes.items())},
+            'avg_forward_ms': round(self._forward_time / self._batches * 1000, 2) if self._batches else 0.0,
+            'avg_queue_wait_ms': round(self._wait_time / self._requests * 1000, 2) if self._requests else 0.0,
+            'last_batch_ms': round(self._last_batch_ms, 2),
+        }
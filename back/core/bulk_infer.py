@@ -0,0 +1,227 @@
+"""Score a whole directory tree of scans offline.
+
+Usage (from back/):
+    python -m core.bulk_infer /data/archive --output scores.csv --workers 4 --batch 64
+    python -m core.bulk_infer /data/archive --output scores_parquet --format parquet --backend int8
+
+Images are decoded, resized and cropped in DataLoader worker processes
+(the same preprocessing the API uses), normalized as whole batches in the
+main process and run through the model in batches. Each batch's rows
+(path, predicted class, confidence and the full probability vector) are
+appended to the output as soon as they are computed, so an interrupted run
+keeps everything scored so far; running the same command again skips the
+files already in the output.
+
+CSV output is a single file, flushed after every batch. Parquet output
+(needs pyarrow) is a directory of part files, each written atomically.
+"""
+import csv
+import glob
+import os
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from core.manifest import IMG_EXTENSIONS
+from core.model import load_model, load_inference_model
+from core.preprocess import Preprocessor, normalize
+from core.registry import load_class_names
+
+
+def find_images(root):
+    """Relative paths of every image under `root`, in a stable order"""
+    paths = []
+    for dirpath, dirnames, fnames in os.walk(root, followlinks=True):
+        dirnames.sort()
+        for fname in sorted(fnames):
+            if fname.lower().endswith(IMG_EXTENSIONS):
+                paths.append(os.path.relpath(os.path.join(dirpath, fname), root))
+    return paths
+
+
+class ImageFiles(Dataset):
+    """Decoded, resized and cropped uint8 arrays; unreadable files yield None plus the error"""
+
+    def __init__(self, root, paths, preprocessor=None):
+        self.root = root
+        self.paths = paths
+        self.preprocessor = preprocessor or Preprocessor()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, idx):
+        path = self.paths[idx]
+        try:
+            return path, np.asarray(self.preprocessor.load(os.path.join(self.root, path))), None
+        except Exception as e:
+            return path, None, str(e)
+
+
+def collate(items):
+    """Stack the decodable images; keep (path, error) for the rest"""
+    ok = [(path, array) for path, array, _ in items if array is not None]
+    failed = [(path, error) for path, array, error in items if array is None]
+    arrays = np.stack([array for _, array in ok]) if ok else None
+    return [path for path, _ in ok], arrays, failed
+
+
+class CsvOutput:
+    """Append-only CSV; already scored paths are read back on start"""
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            self._drop_partial_line()
+        self._file = open(path, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        if not exists:
+            self._writer.writerow(columns)
+            self._file.flush()
+
+    def _drop_partial_line(self):
+        # A run killed mid-write can leave half a row at the end
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def scored(self):
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, newline='') as f:
+            return {row['path'] for row in csv.DictReader(f)}
+
+    def write(self, rows):
+        self._writer.writerows([[row.get(column, '') for column in self.columns] for row in rows])
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetOutput:
+    """Directory of part-NNNNN.parquet files, one per `rows_per_part` rows"""
+
+    def __init__(self, path, columns, rows_per_part=4096):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow), or use --format csv")
+        self.path = path
+        self.columns = columns
+        self.rows_per_part = rows_per_part
+        self._rows = []
+        os.makedirs(path, exist_ok=True)
+        self._next_part = len(glob.glob(os.path.join(path, 'part-*.parquet')))
+
+    def scored(self):
+        import pyarrow.parquet as pq
+        paths = set()
+        for part in sorted(glob.glob(os.path.join(self.path, 'part-*.parquet'))):
+            paths.update(pq.read_table(part, columns=['path']).column('path').to_pylist())
+        return paths
+
+    def write(self, rows):
+        self._rows.extend(rows)
+        if len(self._rows) >= self.rows_per_part:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.table({column: [row.get(column) for row in self._rows] for column in self.columns})
+        part = os.path.join(self.path, f'part-{self._next_part:05d}.parquet')
+        pq.write_table(table, part + '.tmp')
+        os.replace(part + '.tmp', part)
+        self._next_part += 1
+        self._rows = []
+
+    def close(self):
+        self._flush()
+
+
+def score(root, output, fmt='csv', checkpoint='models/brain_tumor_model.pth', backend='eager', batch_size=64,
+          num_workers=4, threads=None, report_every=10.0, class_mapping='models/class_mapping.json'):
+    if threads:
+        torch.set_num_threads(threads)
+    class_names = load_class_names(class_mapping)
+    columns = ['path', 'predicted_class', 'confidence'] + [f'prob_{name}' for name in class_names] + ['error']
+    out = ParquetOutput(output, columns) if fmt == 'parquet' else CsvOutput(output, columns)
+
+    paths = find_images(root)
+    done = out.scored()
+    todo = [path for path in paths if path not in done]
+    print(f"{len(paths)} images under {root}, {len(paths) - len(todo)} already scored, {len(todo)} to go")
+    if not todo:
+        out.close()
+        return
+
+    if not os.path.exists(checkpoint):
+        raise FileNotFoundError(f"Checkpoint not found: {checkpoint}")
+    model = load_model(num_classes=len(class_names), device='cpu', checkpoint_path=checkpoint, pretrained=False)
+    model.eval()
+    model = load_inference_model(backend, model, checkpoint_path=checkpoint)
+
+    loader = DataLoader(ImageFiles(root, todo), batch_size=batch_size, num_workers=num_workers,
+                        collate_fn=collate, persistent_workers=False)
+    started = last_report = time.perf_counter()
+    scored = failed_total = 0
+    try:
+        for batch_paths, arrays, failed in loader:
+            rows = [{'path': path, 'error': error} for path, error in failed]
+            if arrays is not None:
+                with torch.inference_mode():
+                    probabilities = torch.softmax(model(normalize(arrays)), dim=1).numpy()
+                for path, probs in zip(batch_paths, probabilities):
+                    row = {'path': path, 'predicted_class': class_names[int(probs.argmax())],
+                           'confidence': float(probs.max()), 'error': ''}
+                    row.update({f'prob_{name}': float(p) for name, p in zip(class_names, probs)})
+                    rows.append(row)
+            out.write(rows)
+            scored += len(rows)
+            failed_total += len(failed)
+
+            now = time.perf_counter()
+            if now - last_report >= report_every:
+                rate = scored / (now - started)
+                eta = (len(todo) - scored) / rate if rate else float('inf')
+                print(f"{scored}/{len(todo)} images | {rate:.1f} img/s | ETA {eta / 60:.1f} min"
+                      f" | {failed_total} unreadable")
+                last_report = now
+    finally:
+        out.close()
+    elapsed = time.perf_counter() - started
+    print(f"Scored {scored} images in {elapsed:.1f}s ({scored / elapsed:.1f} img/s), "
+          f"{failed_total} unreadable -> {output}")
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Batch-score every image under a directory')
+    parser.add_argument('root', type=str)
+    parser.add_argument('--output', type=str, default='scores.csv')
+    parser.add_argument('--format', type=str, default=None, choices=['csv', 'parquet'],
+                        help='Defaults to parquet when --output ends without .csv')
+    parser.add_argument('--checkpoint', type=str, default='models/brain_tumor_model.pth')
+    parser.add_argument('--class-mapping', type=str, default='models/class_mapping.json',
+                        help="The checkpoint's class_mapping.json (12 default classes if missing)")
+    parser.add_argument('--backend', type=str, default='eager', choices=['eager', 'torchscript', 'int8', 'onnx'])
+    parser.add_argument('--batch', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=4, help='Decode processes')
+    parser.add_argument('--threads', type=int, default=None, help='Torch threads for inference')
+    parser.add_argument('--report-every', type=float, default=10.0, help='Seconds between progress lines')
+    args = parser.parse_args()
+    fmt = args.format or ('csv' if args.output.endswith('.csv') else 'parquet')
+    score(args.root, args.output, fmt, args.checkpoint, args.backend, args.batch, args.workers, args.threads,
+          args.report_every, args.class_mapping)
+
+
+if __name__ == '__main__':
+    main()
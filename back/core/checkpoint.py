@@ -0,0 +1,153 @@
+"""Full-state training checkpoints written in the background.
+
+`snapshot()` copies model/optimizer/scheduler state and RNG states to CPU on
+the training thread (cheap, and the loop can keep mutating the live
+tensors); serialization and disk I/O then run on a single writer thread.
+Every file is written to a temporary name, fsynced and moved into place with
+os.replace, so a crash mid-write never leaves a truncated
+models/brain_tumor_model.pth behind.
+
+Layout (directory defaults to models/):
+  brain_tumor_model.pth        plain state_dict of the latest epoch (what the API loads)
+  brain_tumor_model_best.pth   plain state_dict of the best epoch
+  checkpoints/epoch_0007.pt    full training state, only the last `keep_last` kept
+  checkpoints/best.pt          full training state of the best epoch
+"""
+import glob
+import os
+import random
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+
+def _to_cpu(obj):
+    """Detached CPU copy of every tensor in a nested state structure"""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True).contiguous()
+    if isinstance(obj, dict):
+        return {key: _to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(value) for value in obj)
+    return obj
+
+
+def atomic_save(obj, path):
+    """torch.save to a temporary file in the same directory, then rename over `path`"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            torch.save(obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def rng_state():
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def load_checkpoint(path, map_location='cpu'):
+    """Full training state from `path`.
+
+    Legacy files (a bare model state_dict, e.g. brain_tumor_model_epoch3.pth)
+    come back as {'model': state_dict, 'epoch': <from the filename or 0>}.
+    """
+    # Full checkpoints hold RNG states (numpy arrays, tuples), so no weights_only here
+    checkpoint = torch.load(path, map_location=map_location, weights_only=False)
+    if isinstance(checkpoint, dict) and 'model' in checkpoint and 'epoch' in checkpoint:
+        return checkpoint
+    match = re.search(r'epoch_?(\d+)', os.path.basename(path))
+    return {'model': checkpoint, 'epoch': int(match.group(1)) if match else 0}
+
+
+class CheckpointManager:
+    """Asynchronous, atomic checkpoint writer with keep-last-N / keep-best retention"""
+
+    def __init__(self, directory='models', name='brain_tumor_model', keep_last=3):
+        self.directory = directory
+        self.main_path = os.path.join(directory, f'{name}.pth')
+        self.best_path = os.path.join(directory, f'{name}_best.pth')
+        self.checkpoint_dir = os.path.join(directory, 'checkpoints')
+        self.keep_last = keep_last
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='checkpoint')
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def epoch_path(self, epoch):
+        return os.path.join(self.checkpoint_dir, f'epoch_{epoch:04d}.pt')
+
+    def latest(self):
+        """Newest full checkpoint on disk, or None"""
+        paths = sorted(glob.glob(os.path.join(self.checkpoint_dir, 'epoch_*.pt')))
+        return paths[-1] if paths else None
+
+    def snapshot(self, model, optimizer=None, scheduler=None, epoch=0, **extra):
+        """CPU copy of the full training state; `extra` holds metrics and early-stopping counters"""
+        state = {
+            'epoch': epoch,
+            'model': _to_cpu(model.state_dict()),
+            'optimizer': _to_cpu(optimizer.state_dict()) if optimizer is not None else None,
+            'scheduler': scheduler.state_dict() if scheduler is not None else None,
+            'rng': rng_state(),
+        }
+        state.update(extra)
+        return state
+
+    def save(self, state, is_best=False):
+        """Queue the write of `state`; returns immediately (waits only for the previous write)"""
+        with self._lock:
+            # Surface errors from the previous write and keep at most one write in flight
+            self.wait()
+            self._pending = self._writer.submit(self._write, state, is_best)
+
+    def save_weights(self, state_dict, path=None):
+        """Queue an atomic plain state_dict write (defaults to the main model file)"""
+        with self._lock:
+            self.wait()
+            self._pending = self._writer.submit(atomic_save, _to_cpu(state_dict), path or self.main_path)
+
+    def _write(self, state, is_best):
+        atomic_save(state, self.epoch_path(state['epoch']))
+        atomic_save(state['model'], self.main_path)
+        if is_best:
+            atomic_save(state, os.path.join(self.checkpoint_dir, 'best.pt'))
+            atomic_save(state['model'], self.best_path)
+        self._prune()
+
+    def _prune(self):
+        paths = sorted(glob.glob(os.path.join(self.checkpoint_dir, 'epoch_*.pt')))
+        for path in paths[:-self.keep_last] if self.keep_last > 0 else []:
+            os.remove(path)
+
+    def wait(self):
+        """Block until the queued write is on disk (re-raises its error)"""
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            pending.result()
+
+    def close(self):
+        self.wait()
+        self._writer.shutdown(wait=True)
@@ -0,0 +1,101 @@
+"""Runtime settings for the API, read from environment variables."""
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, '') else default
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_str(name, default):
+    value = os.environ.get(name)
+    return value if value not in (None, '') else default
+
+
+# Dynamic micro-batching for /api/predict
+PREDICT_MAX_BATCH_SIZE = _env_int('PREDICT_MAX_BATCH_SIZE', 16)
+PREDICT_MAX_WAIT_MS = _env_float('PREDICT_MAX_WAIT_MS', 5.0)
+
+# Multi-file batch prediction (/api/predict/batch)
+BATCH_MAX_FILES = _env_int('BATCH_MAX_FILES', 500)
+BATCH_CHUNK_SIZE = _env_int('BATCH_CHUNK_SIZE', 16)
+DECODE_WORKERS = _env_int('DECODE_WORKERS', min(8, os.cpu_count() or 1))
+DECODE_QUEUE = _env_int('DECODE_QUEUE', 64)
+
+# Content-addressed result cache
+CACHE_MAX_MB = _env_float('CACHE_MAX_MB', 256)
+
+# Execution pools: cheap predictions vs expensive explanations
+PREDICT_WORKERS = _env_int('PREDICT_WORKERS', 2)
+PREDICT_QUEUE = _env_int('PREDICT_QUEUE', 64)
+EXPLAIN_WORKERS = _env_int('EXPLAIN_WORKERS', 1)
+EXPLAIN_QUEUE = _env_int('EXPLAIN_QUEUE', 8)
+
+# Explanation image encoding ('png' or 'webp') and output height in pixels
+EXPLAIN_IMAGE_FORMAT = _env_str('EXPLAIN_IMAGE_FORMAT', 'png')
+EXPLAIN_IMAGE_SIZE = _env_int('EXPLAIN_IMAGE_SIZE', 320)
+
+# LIME defaults (num_samples / num_features can be overridden per request)
+LIME_NUM_SAMPLES = _env_int('LIME_NUM_SAMPLES', 100)
+LIME_NUM_FEATURES = _env_int('LIME_NUM_FEATURES', 10)
+LIME_BATCH_SIZE = _env_int('LIME_BATCH_SIZE', 32)
+# Streaming LIME (/api/explain/stream): samples per round, hard cap (also for the
+# per-request num_samples of every LIME endpoint), and how many consecutive
+# rounds the top-feature ranking must stay unchanged before stopping
+LIME_ROUND_SAMPLES = _env_int('LIME_ROUND_SAMPLES', 50)
+LIME_MAX_SAMPLES = _env_int('LIME_MAX_SAMPLES', 1000)
+LIME_PATIENCE = _env_int('LIME_PATIENCE', 2)
+
+# SHAP attributions: 'gradient_shap' or 'integrated_gradients'
+SHAP_METHOD = _env_str('SHAP_METHOD', 'gradient_shap')
+SHAP_N_SAMPLES = _env_int('SHAP_N_SAMPLES', 32)
+SHAP_N_STEPS = _env_int('SHAP_N_STEPS', 32)
+ATTRIBUTION_BATCH_SIZE = _env_int('ATTRIBUTION_BATCH_SIZE', 16)
+ATTRIBUTION_MAX_MEMORY_MB = _env_int('ATTRIBUTION_MAX_MEMORY_MB', 2048)
+
+# Inference backend for predictions: eager | torchscript | int8 | onnx (see core.export)
+MODEL_BACKEND = _env_str('MODEL_BACKEND', 'eager')
+
+# CPU-tuned eager inference (MODEL_BACKEND=eager), each checked against FP32 logits
+EAGER_FOLD_BN = _env_bool('EAGER_FOLD_BN', True)
+EAGER_CHANNELS_LAST = _env_bool('EAGER_CHANNELS_LAST', True)
+EAGER_BF16 = _env_bool('EAGER_BF16', False)
+EAGER_COMPILE = _env_bool('EAGER_COMPILE', False)
+EAGER_TOLERANCE = _env_float('EAGER_TOLERANCE', 1e-2)
+EAGER_BF16_TOLERANCE = _env_float('EAGER_BF16_TOLERANCE', 0.25)
+WARMUP = _env_bool('WARMUP', True)
+
+# Startup
+MODEL_PATH = _env_str('MODEL_PATH', 'models/brain_tumor_model.pth')
+# Class names of MODEL_PATH (written by BrainTumorDataset.save_class_mapping)
+CLASS_MAPPING_PATH = _env_str('CLASS_MAPPING_PATH', 'models/class_mapping.json')
+# Registry name of the startup model; requests select another with the X-Model-Version header
+MODEL_VERSION = _env_str('MODEL_VERSION', 'default')
+# X-Admin-Token for the /api/models admin endpoints; they are disabled while this is empty
+ADMIN_TOKEN = _env_str('ADMIN_TOKEN', '')
+# Without a checkpoint, start from ImageNet weights (needs network/cache); 0 = random init
+PRETRAINED_FALLBACK = _env_bool('PRETRAINED_FALLBACK', True)
+# Load the model in a background thread so /health answers during startup
+BACKGROUND_STARTUP = _env_bool('BACKGROUND_STARTUP', True)
+
+# Per-request JSON log lines for this fraction of requests (errors are always logged)
+LOG_SAMPLE_RATE = _env_float('LOG_SAMPLE_RATE', 0.01)
+
+# Explanation jobs (/api/jobs): store location, result TTL, worker threads, queue cap and max long-poll
+JOB_DIR = _env_str('JOB_DIR', 'models/jobs')
+JOB_TTL_SECONDS = _env_int('JOB_TTL_SECONDS', 24 * 3600)
+JOB_WORKERS = _env_int('JOB_WORKERS', 1)
+JOB_MAX_QUEUE = _env_int('JOB_MAX_QUEUE', 256)
+JOB_MAX_WAIT = _env_float('JOB_MAX_WAIT', 60.0)
@@ -1,9 +1,10 @@
 import torch
 from torch.utils.data import Dataset, DataLoader
-from torchvision import datasets
-from PIL import Image
 import os
 import json
+from core.preprocess import decode_image
+from core.shard_cache import ImageShard
+from core.manifest import DatasetManifest
 
 # Extended class mapping for 12 tumor types
 # Updated to match ImageFolder alphabetical order
@@ -70,36 +71,22 @@ class BrainTumorDataset(Dataset):
         schwannoma/
         tuberculoma/
     """
-    def __init__(self, data_dir: str, transform=None):
+    def __init__(self, data_dir: str, transform=None, cache_dir=None, cache_size=256, manifest=None):
         self.transform = transform
         self.data_dir = data_dir
-        
-        # Use ImageFolder to load data
-        self.ifolder = datasets.ImageFolder(root=data_dir, transform=None)
-        
-        # Map ImageFolder classes to our internal class mapping
-        self.samples = []
+
+        # One folder walk (ImageFolder order); labels come from folder names, no image is opened
+        if manifest is None:
+            manifest = DatasetManifest.scan(data_dir)
+        self.manifest = manifest
+        self.samples = manifest.samples()
         self.class_to_idx = {}
         self.idx_to_class = {}
-        
-        # Build class mapping
-        found_classes = set()
-        for path, class_idx in self.ifolder.samples:
-            folder_name = os.path.basename(os.path.dirname(path)).lower()
-            mapped_class = None
-            
-            # Find matching class in our mapping
-            for k, v in CLASS_MAPPING.items():
-                if k in folder_name:
-                    mapped_class = v
-                    break
-            
-            if mapped_class is not None:
-                self.samples.append((path, mapped_class))
-                found_classes.add(mapped_class)
-            else:
-                print(f"Warning: Class folder '{folder_name}' not mapped. Skipping {path}")
-        
+
+        for folder, count in manifest.unmapped.items():
+            print(f"Warning: Class folder '{os.path.basename(folder)}' not mapped. Skipping {count} images")
+        found_classes = set(manifest.labels)
+
         # Check if we have all 12 classes
         if len(found_classes) != 12:
             print(f"WARNING: Expected 12 classes but found {len(found_classes)} classes")
@@ -116,12 +103,22 @@ class BrainTumorDataset(Dataset):
         print(f"Found {self.num_classes} classes: {sorted(found_classes)}")
         print(f"Class mapping: {self.idx_to_class}")
 
+        # Optional decoded-image shard: decode once, memory-map afterwards
+        self.shard = None
+        if cache_dir:
+            self.shard = ImageShard(cache_dir, self.samples, size=cache_size,
+                                    fingerprint=manifest.fingerprint()).ensure()
+
     def __len__(self):
         return len(self.samples)
 
     def __getitem__(self, idx):
         img_path, label = self.samples[idx]
-        image = Image.open(img_path).convert('RGB')
+        if self.shard is not None:
+            image = self.shard.image(idx)
+        else:
+            # Reduced-size JPEG decode; every transform downsizes to 224 anyway
+            image = decode_image(img_path)
         if self.transform:
             image = self.transform(image)
         return image, label
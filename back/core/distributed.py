@@ -0,0 +1,116 @@
+"""Multi-process data-parallel training on CPU (torch.distributed, gloo backend).
+
+Launch one process per socket/NUMA node (or a few per machine) with torchrun:
+
+    torchrun --nproc_per_node=4 -m core.train --distributed --data data/Training
+    torchrun --nnodes=2 --node_rank=0 --master_addr=HOST --nproc_per_node=4 -m core.train --distributed
+
+Each rank trains on its own slice of the class-balanced sample and DDP
+averages gradients; metrics are reduced across ranks and only rank 0 writes
+checkpoints and logs.
+"""
+import math
+import os
+from contextlib import contextmanager
+
+import torch
+import torch.distributed as dist
+from torch.utils.data import Sampler
+
+
+def setup(backend='gloo'):
+    """Join the process group described by the torchrun environment; returns (rank, world_size)"""
+    if not dist.is_initialized():
+        dist.init_process_group(backend=backend)
+    rank, world_size = dist.get_rank(), dist.get_world_size()
+    # Split the machine's cores between the ranks running on it
+    local_world_size = int(os.environ.get('LOCAL_WORLD_SIZE', world_size))
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // local_world_size))
+    return rank, world_size
+
+
+def cleanup():
+    if dist.is_initialized():
+        dist.destroy_process_group()
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+
+def is_main():
+    return get_rank() == 0
+
+
+def barrier():
+    if is_distributed():
+        dist.barrier()
+
+
+@contextmanager
+def main_first():
+    """Rank 0 runs the block first (e.g. writes a cache), the other ranks after it finishes"""
+    if not is_main():
+        barrier()
+    yield
+    if is_main():
+        barrier()
+
+
+def all_reduce_sum(tensor):
+    """Sum of `tensor` over all ranks (in place; no-op when not distributed)"""
+    if is_distributed():
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor
+
+
+def all_gather_cat(tensor):
+    """Concatenate 1-D tensors of different lengths from all ranks (rank order)"""
+    if not is_distributed():
+        return tensor
+    world_size = dist.get_world_size()
+    length = torch.tensor([tensor.numel()], dtype=torch.long)
+    lengths = [torch.zeros_like(length) for _ in range(world_size)]
+    dist.all_gather(lengths, length)
+    max_length = int(max(l.item() for l in lengths))
+    padded = torch.zeros(max_length, dtype=tensor.dtype)
+    padded[:tensor.numel()] = tensor
+    gathered = [torch.zeros_like(padded) for _ in range(world_size)]
+    dist.all_gather(gathered, padded)
+    return torch.cat([g[:int(l.item())] for g, l in zip(gathered, lengths)])
+
+
+class DistributedWeightedSampler(Sampler):
+    """WeightedRandomSampler split across ranks.
+
+    Every rank draws the same global weighted sample (seeded by seed + epoch)
+    and keeps every world_size-th index, so the ranks together cover exactly
+    one class-balanced epoch without overlap. Call set_epoch() each epoch.
+    """
+
+    def __init__(self, weights, num_samples=None, rank=None, world_size=None, replacement=True, seed=0):
+        self.weights = torch.as_tensor(weights, dtype=torch.double)
+        self.rank = get_rank() if rank is None else rank
+        self.world_size = (dist.get_world_size() if is_distributed() else 1) if world_size is None else world_size
+        total = len(self.weights) if num_samples is None else num_samples
+        self.num_samples = math.ceil(total / self.world_size)
+        self.total_size = self.num_samples * self.world_size
+        self.replacement = replacement
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        indices = torch.multinomial(self.weights, self.total_size, self.replacement, generator=generator)
+        return iter(indices[self.rank:self.total_size:self.world_size].tolist())
+
+    def __len__(self):
+        return self.num_samples
@@ -0,0 +1,119 @@
+import asyncio
+import contextvars
+import functools
+import math
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+
+class Overloaded(Exception):
+    """Raised when a pool's queue is full; the API maps it to 503 + Retry-After"""
+
+    def __init__(self, pool_name, retry_after):
+        super().__init__(f"{pool_name} queue is full, retry in {retry_after}s")
+        self.pool_name = pool_name
+        self.retry_after = retry_after
+
+
+class BoundedExecutor(Executor):
+    """Thread pool with a bounded queue, admission control and wait/compute timing.
+
+    At most `max_workers` tasks run at once and at most `max_queue` more may
+    wait; anything beyond that is rejected immediately with `Overloaded`
+    instead of piling up behind slow work. PyTorch, NumPy and PIL release the
+    GIL in their kernels, so threads give real parallelism for this workload.
+    Time spent waiting for a worker is tracked separately from time spent
+    running, so queueing delay can be told apart from slow compute.
+    """
+
+    def __init__(self, name, max_workers, max_queue):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active = 0
+
+        # Stats
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._compute_total = 0.0
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self.name, self._retry_after())
+            self._pending += 1
+        enqueued = time.perf_counter()
+        started = None
+
+        def task():
+            nonlocal started
+            with self._lock:
+                started = time.perf_counter()
+                self._active += 1
+            failed = False
+            try:
+                return fn(*args, **kwargs)
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self.completed += 1
+                    self.failed += failed
+                    self._wait_total += started - enqueued
+                    self._wait_max = max(self._wait_max, started - enqueued)
+                    self._compute_total += finished - started
+
+        def release(_):
+            # Also runs when a queued task is cancelled before it starts (client gone, waiter cancelled)
+            with self._lock:
+                self._pending -= 1
+                if started is not None:
+                    self._active -= 1
+
+        try:
+            future = self._pool.submit(task)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(release)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """Run `fn` on the pool from async code (in a copy of the caller's context, so per-request state follows)"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self, functools.partial(context.run, fn, *args, **kwargs))
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def _retry_after(self):
+        # Rough time for the current backlog to drain, at least one second
+        avg_compute = self._compute_total / self.completed if self.completed else 1.0
+        return max(1, math.ceil(self._pending * avg_compute / self.max_workers))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'active': self._active,
+                'queued': self._pending - self._active,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'avg_queue_wait_ms': round(self._wait_total / self.completed * 1000, 2) if self.completed else 0.0,
+                'max_queue_wait_ms': round(self._wait_max * 1000, 2),
+                'avg_compute_ms': round(self._compute_total / self.completed * 1000, 2) if self.completed else 0.0,
+            }
@@ -0,0 +1,176 @@
+"""Export a trained checkpoint to optimized CPU inference artifacts.
+
+Usage (from back/):
+    python -m core.export --data data/Training --onnx
+    python -m core.export --checkpoint models/v2.pth
+
+Writes <checkpoint>.ts (TorchScript, frozen), <checkpoint>_int8.ts (INT8
+static quantization calibrated on a training sample) and optionally
+<checkpoint>.onnx next to the checkpoint, e.g. models/brain_tumor_model.ts for
+models/brain_tumor_model.pth, then checks accuracy parity against the FP32
+model on the validation split and benchmarks latency/throughput per batch size.
+The API picks the artifact of each model version's checkpoint with
+MODEL_BACKEND=torchscript|int8|onnx.
+"""
+import copy
+import json
+import os
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset
+
+from core.dataset import BrainTumorDataset
+from core.model import BrainTumorModel, BACKEND_SUFFIXES, OnnxModel
+from core.train import build_transforms, split_indices
+
+
+def load_fp32(checkpoint, num_classes):
+    model = BrainTumorModel(num_classes, pretrained=False)
+    model.load_state_dict(torch.load(checkpoint, map_location='cpu'))
+    return model.eval()
+
+
+def export_torchscript(model, path, example):
+    """Trace + freeze (freezing also folds batch-norms into the convolutions)"""
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(model, example))
+    scripted.save(path)
+    return scripted
+
+
+def quantize_int8(model, calibration_loader, path, example, max_batches=None):
+    """FX graph mode post-training static quantization, saved as TorchScript"""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    engine = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'fbgemm'
+    torch.backends.quantized.engine = engine
+    prepared = prepare_fx(copy.deepcopy(model), get_default_qconfig_mapping(engine), (example,))
+    with torch.no_grad():
+        for i, (inputs, _) in enumerate(calibration_loader):
+            if max_batches is not None and i >= max_batches:
+                break
+            prepared(inputs)
+    quantized = convert_fx(prepared)
+    return export_torchscript(quantized, path, example)
+
+
+def export_onnx(model, path, example):
+    torch.onnx.export(
+        model, example, path,
+        input_names=['input'], output_names=['logits'],
+        dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+        opset_version=17,
+    )
+    return OnnxModel(path)
+
+
+def evaluate(models, loader):
+    """Top-1 accuracy per model plus agreement and max logit difference vs 'fp32'"""
+    correct = {name: 0 for name in models}
+    agree = {name: 0 for name in models}
+    max_diff = {name: 0.0 for name in models}
+    total = 0
+    with torch.no_grad():
+        for inputs, labels in loader:
+            reference = models['fp32'](inputs)
+            ref_pred = reference.argmax(dim=1)
+            for name, model in models.items():
+                logits = reference if name == 'fp32' else model(inputs)
+                pred = logits.argmax(dim=1)
+                correct[name] += (pred == labels).sum().item()
+                agree[name] += (pred == ref_pred).sum().item()
+                max_diff[name] = max(max_diff[name], (logits - reference).abs().max().item())
+            total += labels.size(0)
+    return {
+        name: {
+            'accuracy': round(100 * correct[name] / max(total, 1), 2),
+            'agreement_with_fp32': round(100 * agree[name] / max(total, 1), 2),
+            'max_abs_logit_diff': round(max_diff[name], 4),
+        }
+        for name in models
+    }
+
+
+def benchmark(model, batch_sizes=(1, 8, 32), repeats=10, image_size=224):
+    """Median latency (ms) and throughput (images/s) per batch size"""
+    results = {}
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            x = torch.randn(batch_size, 3, image_size, image_size)
+            for _ in range(2):  # warm-up (JIT profiling, allocator)
+                model(x)
+            timings = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                model(x)
+                timings.append(time.perf_counter() - started)
+            median = float(np.median(timings))
+            results[str(batch_size)] = {
+                'latency_ms': round(median * 1000, 2),
+                'images_per_sec': round(batch_size / median, 1),
+            }
+    return results
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default='data/Training')
+    parser.add_argument('--checkpoint', type=str, default='models/brain_tumor_model.pth')
+    parser.add_argument('--calibration-samples', type=int, default=256)
+    parser.add_argument('--batch', type=int, default=32)
+    parser.add_argument('--onnx', action='store_true', help='Also export ONNX (needs onnx/onnxruntime)')
+    parser.add_argument('--bench-batch-sizes', type=str, default='1,8,32')
+    parser.add_argument('--bench-repeats', type=int, default=10)
+    parser.add_argument('--out', type=str, default=None,
+                        help='Artifact path prefix (default: the checkpoint path without extension, '
+                             'which is where the API looks for them)')
+    parser.add_argument('--report', type=str, default=None, help='Default: <prefix>_export_report.json')
+    args = parser.parse_args()
+    prefix = args.out or os.path.splitext(args.checkpoint)[0]
+    report_path = args.report or f"{prefix}_export_report.json"
+
+    _, val_transform = build_transforms()
+    dataset = BrainTumorDataset(data_dir=args.data, transform=val_transform)
+    train_idx, val_idx = split_indices(len(dataset))
+    rng = np.random.default_rng(0)
+    calib_idx = rng.choice(train_idx, size=min(args.calibration_samples, len(train_idx)), replace=False).tolist()
+    calib_loader = DataLoader(Subset(dataset, calib_idx), batch_size=args.batch, shuffle=False)
+    val_loader = DataLoader(Subset(dataset, val_idx), batch_size=args.batch, shuffle=False)
+
+    model = load_fp32(args.checkpoint, dataset.num_classes)
+    example = torch.randn(1, 3, 224, 224)
+    models = {'fp32': model}
+
+    print("Exporting TorchScript...")
+    models['torchscript'] = export_torchscript(model, prefix + BACKEND_SUFFIXES['torchscript'], example)
+    print(f"Quantizing to INT8 with {len(calib_idx)} calibration images...")
+    models['int8'] = quantize_int8(model, calib_loader, prefix + BACKEND_SUFFIXES['int8'], example)
+    if args.onnx:
+        print("Exporting ONNX...")
+        models['onnx'] = export_onnx(model, prefix + BACKEND_SUFFIXES['onnx'], example)
+
+    print("Checking accuracy parity on the validation split...")
+    parity = evaluate(models, val_loader)
+    batch_sizes = [int(b) for b in args.bench_batch_sizes.split(',')]
+    print("Benchmarking...")
+    perf = {name: benchmark(m, batch_sizes, args.bench_repeats) for name, m in models.items()}
+
+    report = {'parity': parity, 'benchmark': perf, 'threads': torch.get_num_threads()}
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for name in models:
+        p = parity[name]
+        print(f"{name:<12} acc {p['accuracy']:6.2f}%  agree {p['agreement_with_fp32']:6.2f}%  "
+              f"max|dlogit| {p['max_abs_logit_diff']:.4f}")
+        for batch_size, r in perf[name].items():
+            print(f"    batch {batch_size:>3}: {r['latency_ms']:8.2f} ms  {r['images_per_sec']:8.1f} img/s")
+    print(f"Report written to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
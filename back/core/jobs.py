@@ -0,0 +1,314 @@
+"""Asynchronous explanation jobs with a durable local result store.
+
+`POST /api/jobs` stores the upload and a job row and returns a job id right
+away; `GET /api/jobs/{id}?wait=30` polls or long-polls for the result.
+
+The SQLite database is the queue itself: workers claim the highest-priority,
+oldest queued job with a single UPDATE, so several API processes (e.g.
+core.serve workers) can share one job directory. Uploads are stored once per
+content hash and results as JSON blobs next to the database. Finished jobs
+expire after a TTL and are removed with their blobs by the workers.
+
+On start, jobs left 'running' by a process that no longer exists (a crash
+or restart) are put back in the queue, so nothing submitted is lost.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from core.metrics import REGISTRY, start_request
+
+FINAL_STATES = ('done', 'failed')
+
+JOBS = REGISTRY.counter('brain_tumor_jobs_total', 'Explanation jobs by final state', ('method', 'status'))
+JOB_WAIT_SECONDS = REGISTRY.histogram(
+    'brain_tumor_job_wait_seconds', 'Time jobs spent queued before a worker picked them up', ('method',))
+JOB_RUN_SECONDS = REGISTRY.histogram('brain_tumor_job_run_seconds', 'Time spent computing a job', ('method',))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    method TEXT NOT NULL,
+    params TEXT NOT NULL,
+    upload TEXT NOT NULL,
+    owner INTEGER,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, created_at);
+CREATE INDEX IF NOT EXISTS jobs_expiry ON jobs (expires_at);
+"""
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class JobStore:
+    """SQLite job table plus upload/result blob directories under `directory`"""
+
+    def __init__(self, directory='models/jobs', ttl_seconds=86400):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.uploads_dir = os.path.join(directory, 'uploads')
+        self.results_dir = os.path.join(directory, 'results')
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        os.makedirs(self.results_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, 'jobs.sqlite3'), check_same_thread=False,
+                                   isolation_level=None, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(SCHEMA)
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def upload_path(self, digest):
+        return os.path.join(self.uploads_dir, digest)
+
+    def result_path(self, job_id):
+        return os.path.join(self.results_dir, f"{job_id}.json")
+
+    def create(self, digest, contents, method, params, priority=0):
+        """Store the upload (once per content hash) and a queued job -> job id"""
+        if not os.path.exists(self.upload_path(digest)):
+            _write_atomic(self.upload_path(digest), contents)
+        job_id = uuid.uuid4().hex
+        self._execute(
+            'INSERT INTO jobs (id, status, priority, method, params, upload, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (job_id, 'queued', int(priority), method, json.dumps(params), digest, time.time()),
+        )
+        return job_id
+
+    def claim(self):
+        """Atomically move the next queued job (highest priority, then oldest) to 'running' for this process"""
+        rows = self._execute(
+            "UPDATE jobs SET status = 'running', owner = ?, started_at = ? WHERE id = ("
+            "  SELECT id FROM jobs WHERE status = 'queued' ORDER BY priority DESC, created_at LIMIT 1"
+            ") AND status = 'queued' RETURNING *",
+            (os.getpid(), time.time()),
+        )
+        return dict(rows[0]) if rows else None
+
+    def complete(self, job_id, result):
+        _write_atomic(self.result_path(job_id), json.dumps(result).encode())
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET status = 'done', finished_at = ?, expires_at = ? WHERE id = ?",
+            (now, now + self.ttl_seconds, job_id),
+        )
+
+    def fail(self, job_id, error):
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, expires_at = ? WHERE id = ?",
+            (error, now, now + self.ttl_seconds, job_id),
+        )
+
+    def get(self, job_id):
+        rows = self._execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        return dict(rows[0]) if rows else None
+
+    def result(self, job_id):
+        with open(self.result_path(job_id), 'rb') as f:
+            return json.loads(f.read())
+
+    def requeue_orphans(self):
+        """Queue again the jobs whose worker process died mid-run; returns how many"""
+        rows = self._execute("SELECT id, owner FROM jobs WHERE status = 'running'")
+        orphans = [row['id'] for row in rows if row['owner'] == os.getpid() or not _pid_alive(row['owner'])]
+        for job_id in orphans:
+            self._execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, started_at = NULL WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+        return len(orphans)
+
+    def cleanup(self, now=None):
+        """Delete expired jobs, their results and uploads no other job uses; returns how many jobs"""
+        now = now or time.time()
+        expired = self._execute('SELECT id, upload FROM jobs WHERE expires_at IS NOT NULL AND expires_at < ?', (now,))
+        if not expired:
+            return 0
+        self._execute('DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at < ?', (now,))
+        paths = [self.result_path(row['id']) for row in expired]
+        for digest in {row['upload'] for row in expired}:
+            if not self._execute('SELECT 1 FROM jobs WHERE upload = ? LIMIT 1', (digest,)):
+                paths.append(self.upload_path(digest))
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return len(expired)
+
+    def stats(self, now=None):
+        """Queue depth per state and priority, plus the age of the oldest queued and running job"""
+        now = now or time.time()
+        counts = {status: n for status, n in self._execute('SELECT status, COUNT(*) FROM jobs GROUP BY status')}
+        queued_by_priority = {
+            priority: n for priority, n in self._execute(
+                "SELECT priority, COUNT(*) FROM jobs WHERE status = 'queued' GROUP BY priority")
+        }
+        (oldest_queued,), = self._execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'")
+        (oldest_running,), = self._execute("SELECT MIN(started_at) FROM jobs WHERE status = 'running'")
+        return {
+            'queued': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'queued_by_priority': queued_by_priority,
+            'oldest_queued_age_s': round(now - oldest_queued, 3) if oldest_queued else 0.0,
+            'oldest_running_age_s': round(now - oldest_running, 3) if oldest_running else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class JobQueue:
+    """Worker threads running `handler(job, contents) -> result dict` on claimed jobs.
+
+    Submissions from this process wake a worker immediately; jobs queued by
+    other processes sharing the store are picked up within `poll_interval`.
+    """
+
+    def __init__(self, store, handler, workers=1, max_queue=256, poll_interval=1.0, cleanup_interval=300.0):
+        self.store = store
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.max_queue = max_queue
+        self.poll_interval = poll_interval
+        self.cleanup_interval = cleanup_interval
+        self._wakeup = threading.Condition()
+        self._waiters = {}  # job id -> [(loop, future)]
+        self._waiters_lock = threading.Lock()
+        self._threads = []
+        self._stopping = False
+        self._next_cleanup = 0.0
+
+    def start(self):
+        if self._threads:
+            return
+        requeued = self.store.requeue_orphans()
+        if requeued:
+            print(f"Requeued {requeued} interrupted job(s)")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopping = True
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def full(self):
+        return self.max_queue and self.store.stats()['queued'] >= self.max_queue
+
+    def submit(self, digest, contents, method, params, priority=0):
+        job_id = self.store.create(digest, contents, method, params, priority)
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def _work(self):
+        backoff = self.poll_interval
+        while not self._stopping:
+            try:
+                if time.monotonic() >= self._next_cleanup:
+                    self._next_cleanup = time.monotonic() + self.cleanup_interval
+                    self.store.cleanup()
+                job = self.store.claim()
+            except Exception as e:
+                # e.g. "database is locked" while other processes hold the store; keep the worker alive
+                print(f"Job store error in {threading.current_thread().name}: {e}; retrying in {backoff:.1f}s")
+                with self._wakeup:
+                    self._wakeup.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = self.poll_interval
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        method = job['method']
+        JOB_WAIT_SECONDS.observe(job['started_at'] - job['created_at'], method)
+        start_request('job')  # stage timings of the job are recorded under endpoint 'job'
+        started = time.perf_counter()
+        try:
+            with open(self.store.upload_path(job['upload']), 'rb') as f:
+                contents = f.read()
+            result = self.handler(job, contents)
+            self.store.complete(job['id'], result)
+            JOBS.inc(method, 'done')
+        except Exception as e:
+            print(f"Job {job['id']} ({method}) failed: {e}")
+            try:
+                self.store.fail(job['id'], str(e))
+            except Exception as store_error:
+                # Left 'running'; requeued by the next process that starts on this store
+                print(f"Could not record failure of job {job['id']}: {store_error}")
+            JOBS.inc(method, 'failed')
+        JOB_RUN_SECONDS.observe(time.perf_counter() - started, method)
+        self._notify(job['id'])
+
+    def _notify(self, job_id):
+        with self._waiters_lock:
+            waiters = self._waiters.pop(job_id, [])
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+
+    async def wait(self, job_id, timeout):
+        """Job row once it is finished or `timeout` seconds passed (None if unknown/expired)"""
+        deadline = time.monotonic() + timeout
+        loop = asyncio.get_running_loop()
+        while True:
+            job = self.store.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job['status'] in FINAL_STATES or remaining <= 0:
+                return job
+            future = loop.create_future()
+            with self._waiters_lock:
+                self._waiters.setdefault(job_id, []).append((loop, future))
+            # Woken by a local worker; jobs run by another process are noticed by polling
+            try:
+                await asyncio.wait_for(future, min(remaining, self.poll_interval))
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._waiters_lock:
+                    waiters = self._waiters.get(job_id, [])
+                    if (loop, future) in waiters:
+                        waiters.remove((loop, future))
+                        if not waiters:
+                            del self._waiters[job_id]
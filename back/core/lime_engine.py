@@ -0,0 +1,227 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from core.preprocess import IMAGENET_MEAN, IMAGENET_STD
+
+
+class LimeEngine:
+    """Batched LIME for image classifiers.
+
+    Compared to `lime_image.LimeImageExplainer` this:
+      - caches superpixel segmentations per image hash,
+      - draws all perturbation masks as one NumPy array and applies them to
+        the already-normalized input tensor (no denormalize/renormalize
+        round trip and no per-call mean/std tensors),
+      - feeds the model fixed-size batches from a preallocated buffer,
+      - fits the weighted ridge surrogate in closed form with NumPy.
+
+    Hidden superpixels are filled with black (lime's `hide_color=0`).
+    """
+
+    def __init__(self, model, device='cpu', batch_size=32, n_segments=50,
+                 kernel_width=0.25, segmentation_cache_size=64):
+        self.model = model
+        self.device = device
+        self.batch_size = max(1, int(batch_size))
+        self.n_segments = n_segments
+        self.kernel_width = kernel_width
+        self.segmentation_cache_size = segmentation_cache_size
+        self._segments = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        # Normalized value of a black pixel, per channel
+        mean = torch.tensor(IMAGENET_MEAN).view(1, 3, 1, 1)
+        std = torch.tensor(IMAGENET_STD).view(1, 3, 1, 1)
+        self._fill = (-mean / std).to(device)
+        self._mean_np = np.array(IMAGENET_MEAN, dtype=np.float32)
+        self._std_np = np.array(IMAGENET_STD, dtype=np.float32)
+
+    def segment(self, input_tensor, image_key=None):
+        """Superpixel labels [H, W] for an input, cached by `image_key` (or a hash of the tensor)"""
+        if image_key is None:
+            image_key = hashlib.sha1(input_tensor.detach().cpu().numpy().tobytes()).hexdigest()
+        with self._lock:
+            segments = self._segments.get(image_key)
+            if segments is not None:
+                self._segments.move_to_end(image_key)
+                return segments
+
+        img = input_tensor[0].detach().cpu().numpy().transpose(1, 2, 0)
+        img = np.clip(img * self._std_np + self._mean_np, 0, 1)
+        segments = None
+        slic = _slic()
+        if slic is not None:
+            segments = slic(img, n_segments=self.n_segments, compactness=10, start_label=0)
+        if segments is None or segments.max() < 3:
+            # No skimage, or a degenerate (e.g. flat) image: fall back to a regular grid
+            segments = self._grid_segments(img.shape[:2])
+        # Relabel to 0..n-1 in case some labels are empty
+        _, segments = np.unique(segments, return_inverse=True)
+        segments = segments.reshape(img.shape[:2]).astype(np.int64)
+
+        with self._lock:
+            self._segments[image_key] = segments
+            while len(self._segments) > self.segmentation_cache_size:
+                self._segments.popitem(last=False)
+        return segments
+
+    def _grid_segments(self, shape):
+        side = max(1, int(round(np.sqrt(self.n_segments))))
+        rows = np.minimum(np.arange(shape[0]) * side // shape[0], side - 1)
+        cols = np.minimum(np.arange(shape[1]) * side // shape[1], side - 1)
+        return rows[:, None] * side + cols[None, :]
+
+    def sample_masks(self, num_samples, num_superpixels, rng, include_original=True):
+        """Binary on/off matrix [num_samples, num_superpixels]; row 0 is the unperturbed image"""
+        masks = rng.integers(0, 2, size=(num_samples, num_superpixels), dtype=np.uint8)
+        if include_original:
+            masks[0] = 1
+        return masks
+
+    def _buffer(self, shape):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or buffer.shape != shape:
+            buffer = torch.empty(shape, device=self.device)
+            self._local.buffer = buffer
+        return buffer
+
+    def predict_masks(self, input_tensor, segments, masks):
+        """Softmax outputs [num_samples, num_classes] for every perturbation, in fixed-size batches"""
+        _, channels, height, width = input_tensor.shape
+        image = input_tensor.to(self.device)
+        segments_t = torch.from_numpy(segments).to(self.device)
+        buffer = self._buffer((self.batch_size, channels, height, width))
+        outputs = []
+        with torch.inference_mode():
+            for start in range(0, len(masks), self.batch_size):
+                chunk = torch.from_numpy(masks[start:start + self.batch_size]).to(self.device, torch.bool)
+                n = chunk.shape[0]
+                # [n, n_superpixels] -> [n, 1, H, W] pixel masks via the segment index
+                keep = chunk[:, segments_t].unsqueeze(1)
+                torch.where(keep, image, self._fill, out=buffer[:n])
+                outputs.append(torch.softmax(self.model(buffer[:n]), dim=1).cpu())
+        return torch.cat(outputs).numpy()
+
+    def fit(self, masks, predictions, target_class, num_features):
+        """Weighted ridge surrogate on the top `num_features` superpixels -> (features, weights, score)"""
+        X = masks.astype(np.float64)
+        y = predictions[:, target_class].astype(np.float64)
+
+        # Cosine distance to the unperturbed sample, exponential kernel (lime defaults)
+        norms = np.linalg.norm(X, axis=1) * np.sqrt(X.shape[1])
+        distances = 1.0 - X.sum(axis=1) / np.maximum(norms, 1e-12)
+        sample_weight = np.sqrt(np.exp(-(distances ** 2) / self.kernel_width ** 2))
+
+        coef, _ = _weighted_ridge(X, y, sample_weight)
+        features = np.argsort(-np.abs(coef))[:num_features]
+        coef, intercept = _weighted_ridge(X[:, features], y, sample_weight)
+
+        residual = y - (X[:, features] @ coef + intercept)
+        y_mean = np.average(y, weights=sample_weight)
+        ss_res = np.sum(sample_weight * residual ** 2)
+        ss_tot = np.sum(sample_weight * (y - y_mean) ** 2)
+        score = 1.0 - ss_res / ss_tot if ss_tot > 0 else 0.0
+        return features, coef, score
+
+    def explain(self, input_tensor, target_class=None, num_samples=100, num_features=10,
+                image_key=None, random_state=None):
+        """Per-pixel LIME weights [H, W] for `target_class` (top `num_features` superpixels only)"""
+        segments = self.segment(input_tensor, image_key)
+        num_superpixels = int(segments.max()) + 1
+        rng = np.random.default_rng(random_state)
+
+        masks = self.sample_masks(max(2, int(num_samples)), num_superpixels, rng)
+        predictions = self.predict_masks(input_tensor, segments, masks)
+        if target_class is None:
+            target_class = int(predictions[0].argmax())
+
+        features, coef, score = self.fit(masks, predictions, target_class,
+                                         min(max(1, int(num_features)), num_superpixels))
+        return _pixel_weights(segments, num_superpixels, features, coef), target_class, {
+            'num_superpixels': num_superpixels,
+            'num_samples': len(masks),
+            'score': float(score),
+        }
+
+    def explain_progressive(self, input_tensor, target_class=None, num_features=10, round_samples=50,
+                            max_samples=1000, patience=2, image_key=None, random_state=None):
+        """Yield LIME maps refined round by round until the top superpixels settle.
+
+        Every round adds `round_samples` perturbations and refits the surrogate on
+        all samples so far. Stops once the same `num_features` superpixels (in
+        any order) came out on top `patience` rounds in a row, or at
+        `max_samples`. Yields (per-pixel weights [H, W], target_class, info);
+        info['done'] is True on the last one.
+        """
+        segments = self.segment(input_tensor, image_key)
+        num_superpixels = int(segments.max()) + 1
+        num_features = min(max(1, int(num_features)), num_superpixels)
+        max_samples = max(2, int(max_samples))
+        round_samples = min(max(2, int(round_samples)), max_samples)
+        rng = np.random.default_rng(random_state)
+
+        masks = np.empty((0, num_superpixels), dtype=np.uint8)
+        predictions = None
+        top = None
+        stable_rounds = 0
+        round_index = 0
+        while True:
+            new_masks = self.sample_masks(min(round_samples, max_samples - len(masks)), num_superpixels, rng,
+                                          include_original=round_index == 0)
+            new_predictions = self.predict_masks(input_tensor, segments, new_masks)
+            masks = np.concatenate([masks, new_masks])
+            predictions = new_predictions if predictions is None else np.concatenate([predictions, new_predictions])
+            if target_class is None:
+                target_class = int(predictions[0].argmax())
+
+            features, coef, score = self.fit(masks, predictions, target_class, num_features)
+            stable_rounds = stable_rounds + 1 if frozenset(features) == top else 0
+            top = frozenset(features)
+            round_index += 1
+            converged = stable_rounds >= patience
+            done = converged or len(masks) >= max_samples
+            yield _pixel_weights(segments, num_superpixels, features, coef), target_class, {
+                'round': round_index,
+                'num_superpixels': num_superpixels,
+                'num_samples': len(masks),
+                'score': float(score),
+                'top_features': [int(f) for f in features],
+                'stable_rounds': stable_rounds,
+                'converged': converged,
+                'done': done,
+            }
+            if done:
+                return
+
+
+def _pixel_weights(segments, num_superpixels, features, coef):
+    superpixel_weights = np.zeros(num_superpixels, dtype=np.float32)
+    superpixel_weights[features] = coef
+    return superpixel_weights[segments]
+
+
+def _slic():
+    """scikit-image is imported on first use to keep API startup fast"""
+    try:
+        from skimage.segmentation import slic
+        return slic
+    except Exception:
+        return None
+
+
+def _weighted_ridge(X, y, sample_weight, alpha=1.0):
+    """Closed-form Ridge(alpha) with intercept and sample weights, like sklearn's"""
+    w = sample_weight / sample_weight.sum()
+    X_mean = w @ X
+    y_mean = w @ y
+    Xc = X - X_mean
+    yc = y - y_mean
+    Xw = Xc * sample_weight[:, None]
+    A = Xc.T @ Xw + alpha * np.eye(X.shape[1])
+    coef = np.linalg.solve(A, Xw.T @ yc)
+    return coef, y_mean - X_mean @ coef
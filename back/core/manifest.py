@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+
+# Same extensions torchvision.datasets.ImageFolder accepts
+IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', '.webp')
+
+
+@lru_cache(maxsize=None)
+def map_folder(folder_name):
+    """Internal class index for a folder name (first CLASS_MAPPING key it contains), or None"""
+    from core.dataset import CLASS_MAPPING
+    folder_name = folder_name.lower()
+    for key, value in CLASS_MAPPING.items():
+        if key in folder_name:
+            return value
+    return None
+
+
+class DatasetManifest:
+    """Every image under `data_dir` with its mapped label, file size and mtime.
+
+    Built with one directory walk (in ImageFolder order, so index-based
+    train/val splits stay the same) and cached as JSON. `scan()` always walks
+    and stats every file (labels come from the folder names, which is cheap);
+    the previous manifest is only used to report what was added, removed or
+    changed and to skip rewriting an unchanged cache. Datasets, splits and
+    sampler weights read labels from here without opening any image.
+    """
+
+    def __init__(self, data_dir, entries=None, unmapped=None):
+        self.data_dir = data_dir
+        # Parallel lists: path, label, size, mtime_ns
+        self.paths, self.labels, self.sizes, self.mtimes = [], [], [], []
+        for path, label, size, mtime in entries or []:
+            self.paths.append(path)
+            self.labels.append(label)
+            self.sizes.append(size)
+            self.mtimes.append(mtime)
+        self.unmapped = unmapped or {}
+
+    def __len__(self):
+        return len(self.paths)
+
+    @classmethod
+    def scan(cls, data_dir, previous=None):
+        """Walk `data_dir` like ImageFolder; `.changes` counts differences from `previous`"""
+        known = {}
+        if previous is not None and previous.data_dir == data_dir:
+            known = {p: (l, s, m) for p, l, s, m in zip(previous.paths, previous.labels, previous.sizes, previous.mtimes)}
+
+        entries, unmapped = [], {}
+        added = changed = 0
+        class_dirs = sorted(e.name for e in os.scandir(data_dir) if e.is_dir())
+        for class_dir in class_dirs:
+            for root, _, fnames in sorted(os.walk(os.path.join(data_dir, class_dir), followlinks=True)):
+                label = map_folder(os.path.basename(root))
+                for fname in sorted(fnames):
+                    if not fname.lower().endswith(IMG_EXTENSIONS):
+                        continue
+                    path = os.path.join(root, fname)
+                    if label is None:
+                        unmapped[root] = unmapped.get(root, 0) + 1
+                        continue
+                    stat = os.stat(path)
+                    old = known.pop(path, None)
+                    if old is None:
+                        added += 1
+                    elif old[1:] != (stat.st_size, stat.st_mtime_ns):
+                        changed += 1
+                    entries.append((path, label, stat.st_size, stat.st_mtime_ns))
+
+        manifest = cls(data_dir, entries, unmapped)
+        manifest.changes = {'added': added, 'changed': changed, 'removed': len(known)}
+        return manifest
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['data_dir'], zip(data['paths'], data['labels'], data['sizes'], data['mtimes']),
+                   data.get('unmapped'))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'data_dir': self.data_dir,
+                'paths': self.paths,
+                'labels': self.labels,
+                'sizes': self.sizes,
+                'mtimes': self.mtimes,
+                'unmapped': self.unmapped,
+            }, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_or_build(cls, data_dir, path='models/dataset_manifest.json'):
+        """Load the cached manifest, bring it up to date with the folder and save it back"""
+        previous = None
+        if path and os.path.exists(path):
+            try:
+                previous = cls.load(path)
+            except (ValueError, KeyError):
+                previous = None
+        manifest = cls.scan(data_dir, previous)
+        if path and (previous is None or any(manifest.changes.values())
+                     or previous.data_dir != data_dir):
+            manifest.save(path)
+        print(f"Dataset manifest: {len(manifest)} images ({manifest.changes})")
+        return manifest
+
+    def samples(self):
+        return list(zip(self.paths, self.labels))
+
+    def labels_array(self):
+        return np.asarray(self.labels, dtype=np.int64)
+
+    def fingerprint(self):
+        """Hash of paths, sizes, mtimes and labels (matches shard_cache.samples_fingerprint)"""
+        digest = hashlib.sha1()
+        for path, size, mtime, label in zip(self.paths, self.sizes, self.mtimes, self.labels):
+            digest.update(f"{path}\0{size}\0{mtime}\0{label}\n".encode())
+        return digest.hexdigest()
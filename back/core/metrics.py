@@ -0,0 +1,221 @@
+"""Prometheus-style metrics, per-request stage timing and sampled request logs.
+
+`stage("decode")` times a block, records it in the stage latency histogram
+(labelled by endpoint, stage and XAI method) and adds it to the current
+request's timings, which the API returns as a Server-Timing header. The
+request timer lives in a context variable, so stages recorded inside
+BoundedExecutor workers still land on the right request. `/metrics` serves
+`REGISTRY.render()` in the Prometheus text exposition format.
+
+Per-request logs are single JSON lines emitted for a sample of requests
+(LOG_SAMPLE_RATE) and for every error, instead of several prints per request.
+"""
+import bisect
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; fine at the low end for decode/encode, coarse for LIME
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), series):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]:.6f}')
+                lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """Current values read at render time: `callback()` returns {label tuple: value}"""
+
+    def __init__(self, name, help, labelnames=(), callback=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        values = self.callback() if self.callback else {}
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help, labelnames=(), callback=None):
+        metric = Gauge(name, help, labelnames, callback)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return '\n'.join(line for metric in self.metrics for line in metric.render()) + '\n'
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram(
+    'brain_tumor_stage_seconds', 'Latency of one processing stage', ('endpoint', 'stage', 'method'))
+REQUEST_SECONDS = REGISTRY.histogram(
+    'brain_tumor_request_seconds', 'End-to-end request latency', ('endpoint', 'status'))
+REQUESTS = REGISTRY.counter('brain_tumor_requests_total', 'Requests handled', ('endpoint', 'status'))
+ERRORS = REGISTRY.counter('brain_tumor_errors_total', 'Failed requests and stages', ('endpoint', 'kind'))
+FALLBACKS = REGISTRY.counter(
+    'brain_tumor_model_fallbacks_total', 'Times a faster or requested model path fell back', ('kind',))
+
+
+class RequestTimer:
+    """Stage durations of one request, in the order they finished"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = []  # (stage, method, seconds)
+
+    def record(self, stage, seconds, method=''):
+        self.stages.append((stage, method, seconds))
+        STAGE_SECONDS.observe(seconds, self.endpoint, stage, method)
+
+    def totals(self):
+        """Seconds per stage ('stage' or 'stage-method'), repeated stages summed"""
+        totals = {}
+        for stage, method, seconds in self.stages:
+            key = f'{stage}-{method}' if method else stage
+            totals[key] = totals.get(key, 0.0) + seconds
+        return totals
+
+    def server_timing(self):
+        """Server-Timing header value: one entry per stage plus the total, durations in ms"""
+        entries = [f'{key};dur={seconds * 1000:.2f}' for key, seconds in self.totals().items()]
+        entries.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.2f}')
+        return ', '.join(entries)
+
+
+_current = contextvars.ContextVar('request_timer', default=None)
+
+
+def start_request(endpoint):
+    timer = RequestTimer(endpoint)
+    _current.set(timer)
+    return timer
+
+
+def current_request():
+    return _current.get()
+
+
+@contextmanager
+def stage(name, method=''):
+    """Time a block as `name`; recorded against the current request (or endpoint 'background')"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        timer = _current.get()
+        if timer is not None:
+            timer.record(name, seconds, method)
+        else:
+            STAGE_SECONDS.observe(seconds, 'background', name, method)
+
+
+def count_error(kind):
+    """Count an error against the current request's endpoint"""
+    timer = _current.get()
+    ERRORS.inc(timer.endpoint if timer is not None else 'background', kind)
+
+
+logger = logging.getLogger('brain_tumor.requests')
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def log_request(timer, status, sample_rate, **fields):
+    """One JSON line for a sampled request; errors (status >= 500) are always logged"""
+    if status < 500 and (sample_rate <= 0 or random.random() >= sample_rate):
+        return
+    record = {
+        'endpoint': timer.endpoint,
+        'status': status,
+        'duration_ms': round((time.perf_counter() - timer.started) * 1000, 2),
+        'stages_ms': {key: round(seconds * 1000, 2) for key, seconds in timer.totals().items()},
+        **fields,
+    }
+    (logger.error if status >= 500 else logger.info)(json.dumps(record))
@@ -1,3 +1,4 @@
+import os
 import torch
 import torch.nn as nn
 from torchvision import models
@@ -19,8 +20,20 @@ class BrainTumorModel(nn.Module):
         return x
 
 # Function to load the model
-def load_model(num_classes=4, device='cuda' if torch.cuda.is_available() else 'cpu'):
-    model = BrainTumorModel(num_classes)
+def load_model(num_classes=4, device='cuda' if torch.cuda.is_available() else 'cpu', checkpoint_path=None,
+               pretrained=True):
+    """Build the model, loading `checkpoint_path` if it exists.
+
+    With a checkpoint the ImageNet weights would be overwritten anyway, so the
+    backbone is built without them (no download, works offline) and the state
+    dict is memory-mapped and assigned in place instead of copied.
+    """
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        model = BrainTumorModel(num_classes, pretrained=False)
+        state_dict = torch.load(checkpoint_path, map_location='cpu', mmap=True, weights_only=True)
+        model.load_state_dict(state_dict, assign=True)
+    else:
+        model = BrainTumorModel(num_classes, pretrained=pretrained)
     model.to(device)
     return model
 
@@ -33,3 +46,58 @@ def load_checkpoint(model, path, device='cuda' if torch.cuda.is_available() else
     model.load_state_dict(torch.load(path, map_location=device))
     model.to(device)
     return model
+
+# Optimized inference artifacts written by `python -m core.export`, named after
+# the checkpoint they were exported from: models/v2.pth -> models/v2.ts, models/v2_int8.ts, ...
+BACKEND_SUFFIXES = {
+    'torchscript': '.ts',
+    'int8': '_int8.ts',
+    'onnx': '.onnx',
+}
+
+def artifact_path(backend, checkpoint_path):
+    """Path of the `backend` artifact exported from `checkpoint_path`"""
+    suffix = BACKEND_SUFFIXES.get(backend)
+    if suffix is None:
+        raise ValueError(f"Unknown model backend: {backend}")
+    return os.path.splitext(checkpoint_path)[0] + suffix
+
+class OnnxModel:
+    """Callable wrapper so an onnxruntime session can stand in for the torch model"""
+    def __init__(self, path, num_threads=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x):
+        outputs = self.session.run(None, {self.input_name: x.detach().cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
+    def eval(self):
+        return self
+
+# Function to load a no-grad inference model for the configured backend
+def load_inference_model(backend, model=None, device='cpu', checkpoint_path='models/brain_tumor_model.pth'):
+    """Return a callable for batched inference.
+
+    'eager' returns `model` unchanged; 'torchscript', 'int8' and 'onnx' load the
+    artifact exported from `checkpoint_path`. Falls back to eager when the
+    artifact is missing so a fresh checkout still serves.
+    """
+    if backend == 'eager':
+        return model
+    path = artifact_path(backend, checkpoint_path)
+    if not os.path.exists(path):
+        print(f"Warning: {backend} artifact {path} not found, using eager model")
+        return model
+    if backend == 'onnx':
+        return OnnxModel(path)
+    if backend == 'int8':
+        torch.backends.quantized.engine = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'fbgemm'
+    loaded = torch.jit.load(path, map_location=device)
+    loaded.eval()
+    print(f"Loaded {backend} inference model from {path}")
+    return loaded
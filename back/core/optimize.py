@@ -0,0 +1,131 @@
+import copy
+import time
+
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+
+def fold_batchnorm(model):
+    """Copy of `model` with every Conv2d -> BatchNorm2d pair fused into one conv (eval only).
+
+    Handles the ResNet naming scheme (convN/bnN siblings) and Sequential
+    pairs such as the `downsample` branches.
+    """
+    model = copy.deepcopy(model).eval()
+    for module in model.modules():
+        children = dict(module.named_children())
+        if isinstance(module, nn.Sequential):
+            names = list(children)
+            for conv_name, bn_name in zip(names, names[1:]):
+                conv, bn = children[conv_name], children[bn_name]
+                if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+                    setattr(module, conv_name, fuse_conv_bn_eval(conv, bn))
+                    setattr(module, bn_name, nn.Identity())
+            continue
+        for name, bn in children.items():
+            if not (name.startswith('bn') and isinstance(bn, nn.BatchNorm2d)):
+                continue
+            conv = children.get('conv' + name[2:])
+            if isinstance(conv, nn.Conv2d):
+                setattr(module, 'conv' + name[2:], fuse_conv_bn_eval(conv, bn))
+                setattr(module, name, nn.Identity())
+    return model
+
+
+def bf16_supported():
+    """True when the CPU has native bfloat16 support in oneDNN (AVX512-BF16 / AMX)"""
+    try:
+        return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except Exception:
+        return False
+
+
+class OptimizedModel(nn.Module):
+    """Inference wrapper: channels_last inputs and optional bfloat16 autocast, FP32 logits out"""
+
+    def __init__(self, model, channels_last=False, bf16=False):
+        super().__init__()
+        self.model = model
+        self.channels_last = channels_last
+        self.bf16 = bf16
+
+    def forward(self, x):
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        with torch.autocast('cpu', dtype=torch.bfloat16, enabled=self.bf16):
+            return self.model(x).float()
+
+
+def max_logit_diff(reference, candidate, example):
+    with torch.inference_mode():
+        return (reference(example) - candidate(example)).abs().max().item()
+
+
+def optimize_eager_model(model, fold_bn=True, channels_last=True, bf16=False, compile=False,
+                         tolerance=1e-2, bf16_tolerance=0.25, image_size=224):
+    """Apply the enabled CPU optimizations one at a time, each checked against FP32 logits.
+
+    An option whose logits drift further than its tolerance from the reference
+    is skipped with a warning. Returns (model, report).
+    """
+    reference = model.eval()
+    device = next(reference.parameters()).device
+    example = torch.randn(4, 3, image_size, image_size, device=device)
+    report = {}
+    optimized = reference
+
+    if fold_bn:
+        candidate = fold_batchnorm(reference)
+        report['fold_bn'] = _accept('fold_bn', reference, candidate, example, tolerance)
+        optimized = candidate if report['fold_bn']['enabled'] else optimized
+
+    if channels_last:
+        candidate = OptimizedModel(copy.deepcopy(optimized).to(memory_format=torch.channels_last), channels_last=True)
+        report['channels_last'] = _accept('channels_last', reference, candidate, example, tolerance)
+        optimized = candidate if report['channels_last']['enabled'] else optimized
+
+    if bf16:
+        if bf16_supported():
+            inner = optimized.model if isinstance(optimized, OptimizedModel) else optimized
+            candidate = OptimizedModel(inner, channels_last=channels_last and report['channels_last']['enabled'], bf16=True)
+            report['bf16'] = _accept('bf16', reference, candidate, example, bf16_tolerance)
+            optimized = candidate if report['bf16']['enabled'] else optimized
+        else:
+            print("Warning: CPU has no native bfloat16 support, bf16 autocast disabled")
+            report['bf16'] = {'enabled': False, 'reason': 'unsupported'}
+
+    if compile:
+        try:
+            candidate = torch.compile(optimized)
+            report['compile'] = _accept('compile', reference, candidate, example,
+                                        bf16_tolerance if report.get('bf16', {}).get('enabled') else tolerance)
+            optimized = candidate if report['compile']['enabled'] else optimized
+        except Exception as e:
+            print(f"Warning: torch.compile failed ({e}), running without it")
+            report['compile'] = {'enabled': False, 'reason': str(e)}
+
+    return optimized, report
+
+
+def _accept(name, reference, candidate, example, tolerance):
+    try:
+        diff = max_logit_diff(reference, candidate, example)
+    except Exception as e:
+        print(f"Warning: {name} failed ({e}), skipping")
+        return {'enabled': False, 'reason': str(e)}
+    if diff > tolerance:
+        print(f"Warning: {name} changes logits by {diff:.4g} (> {tolerance}), skipping")
+        return {'enabled': False, 'max_logit_diff': diff}
+    return {'enabled': True, 'max_logit_diff': diff}
+
+
+def warmup(model, batch_sizes=(1,), image_size=224, iterations=2, device='cpu'):
+    """Run dummy batches so compilation/allocation happens before the first real request"""
+    started = time.perf_counter()
+    with torch.inference_mode():
+        for batch_size in batch_sizes:
+            x = torch.randn(batch_size, 3, image_size, image_size, device=device)
+            for _ in range(iterations):
+                model(x)
+    return time.perf_counter() - started
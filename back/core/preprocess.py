@@ -0,0 +1,84 @@
+"""Shared image preprocessing for serving, evaluation and training.
+
+One pipeline used by api.process_image, utils.load_image and the validation
+transform in core.train: shorter side resized to 256, center crop to 224,
+ImageNet normalization. JPEGs are decoded at reduced size through PIL's
+draft mode (DCT scaling), which is much cheaper than a full-resolution decode
+followed by a downscale.
+"""
+import io
+
+import numpy as np
+import torch
+from PIL import Image
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+RESIZE_SIZE = 256
+CROP_SIZE = 224
+
+# (x / 255 - mean) / std  ==  x * _SCALE + _BIAS
+_SCALE = (1.0 / (255.0 * torch.tensor(IMAGENET_STD))).view(1, 3, 1, 1)
+_BIAS = (-torch.tensor(IMAGENET_MEAN) / torch.tensor(IMAGENET_STD)).view(1, 3, 1, 1)
+
+
+def decode_image(source, min_size=RESIZE_SIZE):
+    """Open bytes / a path / a PIL image as RGB, decoding JPEGs at the smallest scale >= min_size"""
+    if isinstance(source, Image.Image):
+        image = source
+    else:
+        image = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+        if image.format == 'JPEG' and min_size:
+            image.draft('RGB', (min_size, min_size))
+    return image.convert('RGB')
+
+
+def resize_center_crop(image, resize=RESIZE_SIZE, crop=CROP_SIZE):
+    """Same geometry as transforms.Resize(resize) + transforms.CenterCrop(crop)"""
+    width, height = image.size
+    if width <= height:
+        new_size = (resize, int(resize * height / width))
+    else:
+        new_size = (int(resize * width / height), resize)
+    if new_size != image.size:
+        image = image.resize(new_size, Image.BILINEAR)
+    width, height = image.size
+    left = int(round((width - crop) / 2.0))
+    top = int(round((height - crop) / 2.0))
+    return image.crop((left, top, left + crop, top + crop))
+
+
+def normalize(arrays, out=None):
+    """uint8 [B, H, W, 3] -> normalized float32 [B, 3, H, W], written into `out` when given"""
+    arrays = np.ascontiguousarray(arrays)
+    if not arrays.flags.writeable:
+        # np.asarray(PIL image) is read-only and torch.from_numpy needs a writable array
+        arrays = arrays.copy()
+    batch = torch.from_numpy(arrays).permute(0, 3, 1, 2)
+    if out is None:
+        out = torch.empty(batch.shape, dtype=torch.float32)
+    out.copy_(batch)
+    return out.mul_(_SCALE).add_(_BIAS)
+
+
+class Preprocessor:
+    """Decode -> resize/crop -> normalize, for single images or batches.
+
+    Also usable as a torchvision-style transform (PIL image in, [3, H, W] tensor out).
+    """
+
+    def __init__(self, resize=RESIZE_SIZE, crop=CROP_SIZE):
+        self.resize = resize
+        self.crop = crop
+
+    def load(self, source):
+        """Decoded, resized and cropped PIL image"""
+        return resize_center_crop(decode_image(source, self.resize), self.resize, self.crop)
+
+    def __call__(self, source):
+        return self.batch([source])[0]
+
+    def batch(self, sources, out=None):
+        """Normalized [B, 3, crop, crop] tensor for a list of bytes / paths / PIL images"""
+        arrays = np.stack([np.asarray(self.load(source)) for source in sources])
+        return normalize(arrays, out)
@@ -0,0 +1,210 @@
+"""Named, hot-swappable model versions for the API.
+
+A `ModelVersion` bundles everything one checkpoint needs to serve: the
+eager model (XAI), the inference model (possibly exported/optimized), its
+micro-batcher and the class names from its class_mapping.json. The
+registry builds versions (load -> backend -> optimize -> warm-up) off the
+request path, then publishes them by replacing a dict under a lock.
+Requests resolve a version once at the start and keep that object, so a
+swap only affects requests that arrive afterwards and in-flight ones finish
+on the version they started with.
+"""
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from core import config
+from core.batching import MicroBatcher
+from core.dataset import CLASS_NAMES
+from core.metrics import FALLBACKS
+from core.model import load_model, load_inference_model
+from core.optimize import optimize_eager_model, warmup
+from core.xai import XAIManager
+
+_ids = itertools.count(1)
+
+
+def load_class_names(path):
+    """Output index -> class name from a BrainTumorDataset.save_class_mapping file (12 defaults if missing)"""
+    if not path or not os.path.exists(path):
+        return list(CLASS_NAMES)
+    with open(path) as f:
+        mapping = json.load(f)
+    idx_to_class = {int(k): v for k, v in mapping.get('idx_to_class', {}).items()}
+    num_classes = mapping.get('num_classes', len(idx_to_class))
+    if idx_to_class and all(i in idx_to_class for i in range(num_classes)):
+        return [idx_to_class[i] for i in range(num_classes)]
+    return list(mapping['class_names'])
+
+
+@contextmanager
+def _timed(phases, name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = round(time.perf_counter() - started, 3)
+
+
+class ModelVersion:
+    def __init__(self, name, checkpoint_path, backend, class_names):
+        self.name = name
+        # Unique per build: cache keys use it, so re-loading a name never serves stale results
+        self.key = f"{name}#{next(_ids)}"
+        self.checkpoint_path = checkpoint_path
+        self.backend = backend
+        self.class_names = class_names
+        self.model = None
+        self.inference_model = None
+        self.xai_manager = None
+        self.batcher = None
+        self.eager_optimizations = {}
+        self.phases = {}
+        self.loaded_at = None
+
+    def status(self):
+        return {
+            'name': self.name,
+            'checkpoint': self.checkpoint_path,
+            'backend': self.backend,
+            'eager_optimizations': self.eager_optimizations,
+            'num_classes': len(self.class_names),
+            'classes': self.class_names,
+            'phases': self.phases,
+            'loaded_at': self.loaded_at,
+            'predict_batching': self.batcher.stats() if self.batcher else None,
+        }
+
+
+class ModelRegistry:
+    def __init__(self, device, predict_executor):
+        self.device = device
+        self.predict_executor = predict_executor
+        self._versions = {}
+        self._default = None
+        self._lock = threading.Lock()
+        self.loading = {}  # name -> {'state': 'loading'|'failed', ...}
+
+    def build(self, name, checkpoint_path, backend=None, class_mapping=None, phase=None):
+        """Load, optimize and warm up a version (slow; call off the request path)"""
+        backend = backend or config.MODEL_BACKEND
+        class_names = load_class_names(class_mapping or config.CLASS_MAPPING_PATH)
+        version = ModelVersion(name, checkpoint_path, backend, class_names)
+        phase = phase or (lambda step: _timed(version.phases, step))
+
+        with phase("load_model"):
+            if not os.path.exists(checkpoint_path):
+                print(f"Warning: Model file {checkpoint_path} not found, using untrained model")
+                FALLBACKS.inc("untrained_model")
+            version.model = load_model(
+                num_classes=len(class_names), device=self.device, checkpoint_path=checkpoint_path,
+                pretrained=config.PRETRAINED_FALLBACK
+            )
+            version.model.eval()
+
+        with phase("inference_backend"):
+            # Predictions may use an exported/quantized artifact; XAI needs gradients and keeps the eager model
+            version.inference_model = load_inference_model(backend, version.model, self.device, checkpoint_path)
+            if backend != 'eager' and version.inference_model is version.model:
+                # No artifact exported from this checkpoint: serve it eagerly rather than another model's weights
+                FALLBACKS.inc(f"backend_{backend}")
+                version.backend = 'eager'
+            if version.inference_model is version.model and self.device == 'cpu':
+                version.inference_model, version.eager_optimizations = optimize_eager_model(
+                    version.model,
+                    fold_bn=config.EAGER_FOLD_BN,
+                    channels_last=config.EAGER_CHANNELS_LAST,
+                    bf16=config.EAGER_BF16,
+                    compile=config.EAGER_COMPILE,
+                    tolerance=config.EAGER_TOLERANCE,
+                    bf16_tolerance=config.EAGER_BF16_TOLERANCE,
+                )
+                for option, result in version.eager_optimizations.items():
+                    # Requested but rejected by the logit check (or failed)
+                    if not result.get('enabled') and result.get('reason') != 'unsupported':
+                        FALLBACKS.inc(f"eager_{option}")
+
+        if config.WARMUP:
+            # Pay compile/allocation cost now instead of on the first request
+            with phase("warmup"):
+                warmup(version.inference_model, (1, config.PREDICT_MAX_BATCH_SIZE), device=self.device)
+
+        # XAI libraries (scikit-image for LIME) are imported on first use
+        version.xai_manager = XAIManager(version.model, self.device)
+        version.batcher = MicroBatcher(
+            version.inference_model,
+            max_batch_size=config.PREDICT_MAX_BATCH_SIZE,
+            max_wait_ms=config.PREDICT_MAX_WAIT_MS,
+            executor=self.predict_executor,
+        )
+        version.loaded_at = time.time()
+        return version
+
+    def register(self, version, activate=False):
+        """Publish `version` under its name (replacing an older build); optionally make it the default"""
+        with self._lock:
+            versions = dict(self._versions)
+            versions[version.name] = version
+            self._versions = versions
+            if activate or self._default is None:
+                self._default = version.name
+            self.loading.pop(version.name, None)
+
+    def load_async(self, name, checkpoint_path, backend=None, class_mapping=None, activate=False):
+        """Build a version in a background thread and register it when warm; returns immediately"""
+        with self._lock:
+            if self.loading.get(name, {}).get('state') == 'loading':
+                raise ValueError(f"Version '{name}' is already loading")
+            self.loading[name] = {'state': 'loading', 'checkpoint': checkpoint_path, 'started_at': time.time()}
+
+        def run():
+            try:
+                version = self.build(name, checkpoint_path, backend, class_mapping)
+                self.register(version, activate=activate)
+                print(f"Model version '{name}' ready ({version.phases}){' and active' if activate else ''}")
+            except Exception as e:
+                print(f"ERROR loading model version '{name}': {e}")
+                with self._lock:
+                    self.loading[name] = {'state': 'failed', 'checkpoint': checkpoint_path, 'error': str(e)}
+
+        threading.Thread(target=run, name=f"model-load-{name}", daemon=True).start()
+
+    def get(self, name=None):
+        """The named version, or the default one; KeyError if unknown"""
+        versions = self._versions
+        name = name or self._default
+        if name not in versions:
+            raise KeyError(name)
+        return versions[name]
+
+    def activate(self, name):
+        with self._lock:
+            if name not in self._versions:
+                raise KeyError(name)
+            self._default = name
+
+    def remove(self, name):
+        """Unregister a non-default version (requests already using it finish normally)"""
+        with self._lock:
+            if name not in self._versions:
+                raise KeyError(name)
+            if name == self._default:
+                raise ValueError("Cannot remove the active version; activate another one first")
+            versions = dict(self._versions)
+            del versions[name]
+            self._versions = versions
+
+    @property
+    def default(self):
+        return self._default
+
+    def status(self):
+        versions = self._versions
+        return {
+            'default': self._default,
+            'versions': {name: version.status() for name, version in versions.items()},
+            'loading': dict(self.loading),
+        }
@@ -0,0 +1,163 @@
+"""Matplotlib-free rendering of XAI heatmaps over the input image.
+
+Everything here is plain NumPy + PIL working on per-call arrays, so it is safe
+to call from several threads at once (pyplot's global figure state is not).
+The blend reproduces the old matplotlib figure: the image drawn with
+alpha 0.8 over a white canvas, the min-max normalized heatmap drawn with
+alpha 0.6 on top, and a colorbar strip on the right.
+"""
+import base64
+import io
+
+import numpy as np
+from PIL import Image, features
+
+# Piecewise-linear colormap definitions (x, value) per channel, as in matplotlib
+_JET = {
+    'red': [(0.0, 0.0), (0.35, 0.0), (0.66, 1.0), (0.89, 1.0), (1.0, 0.5)],
+    'green': [(0.0, 0.0), (0.125, 0.0), (0.375, 1.0), (0.64, 1.0), (0.91, 0.0), (1.0, 0.0)],
+    'blue': [(0.0, 0.5), (0.11, 1.0), (0.34, 1.0), (0.65, 0.0), (1.0, 0.0)],
+}
+_HOT = {
+    'red': [(0.0, 0.0416), (0.365079, 1.0), (1.0, 1.0)],
+    'green': [(0.0, 0.0), (0.365079, 0.0), (0.746032, 1.0), (1.0, 1.0)],
+    'blue': [(0.0, 0.0), (0.746032, 0.0), (1.0, 1.0)],
+}
+# ColorBrewer RdBu, evenly spaced anchors
+_RDBU = [
+    (0.403921568627451, 0.0, 0.12156862745098039),
+    (0.6980392156862745, 0.09411764705882353, 0.16862745098039217),
+    (0.8392156862745098, 0.3764705882352941, 0.30196078431372547),
+    (0.9568627450980393, 0.6470588235294118, 0.5098039215686274),
+    (0.9921568627450981, 0.8588235294117647, 0.7803921568627451),
+    (0.9686274509803922, 0.9686274509803922, 0.9686274509803922),
+    (0.8196078431372549, 0.8980392156862745, 0.9411764705882353),
+    (0.5725490196078431, 0.7725490196078432, 0.8705882352941177),
+    (0.2627450980392157, 0.5764705882352941, 0.7647058823529411),
+    (0.12941176470588237, 0.4, 0.6745098039215687),
+    (0.0196078431372549, 0.18823529411764706, 0.3803921568627451),
+]
+
+_LUT_SIZE = 256
+
+
+def _lut_from_segments(segments):
+    x = np.linspace(0.0, 1.0, _LUT_SIZE)
+    channels = []
+    for name in ('red', 'green', 'blue'):
+        xs, ys = zip(*segments[name])
+        channels.append(np.interp(x, xs, ys))
+    return _to_uint8_lut(np.stack(channels, axis=1))
+
+
+def _lut_from_colors(colors):
+    x = np.linspace(0.0, 1.0, _LUT_SIZE)
+    anchors = np.linspace(0.0, 1.0, len(colors))
+    colors = np.asarray(colors)
+    return _to_uint8_lut(np.stack([np.interp(x, anchors, colors[:, c]) for c in range(3)], axis=1))
+
+
+def _to_uint8_lut(lut):
+    lut = np.round(lut * 255).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+
+COLORMAPS = {
+    'jet': _lut_from_segments(_JET),
+    'hot': _lut_from_segments(_HOT),
+    'RdBu': _lut_from_colors(_RDBU),
+    'RdBu_r': _lut_from_colors(_RDBU[::-1]),
+}
+
+
+def normalize_map(values, symmetric=False):
+    """Scale a 2-D map to [0, 1] (min-max, or +-max|v| around zero for diverging maps)"""
+    values = np.nan_to_num(np.asarray(values, dtype=np.float32))
+    if symmetric:
+        limit = float(np.abs(values).max())
+        vmin, vmax = -limit, limit
+    else:
+        vmin, vmax = float(values.min()), float(values.max())
+    if vmax - vmin < 1e-12:
+        return np.zeros_like(values)
+    return (values - vmin) / (vmax - vmin)
+
+
+def apply_colormap(values01, cmap='jet'):
+    """Map values in [0, 1] to uint8 RGB through a lookup table"""
+    lut = COLORMAPS[cmap]
+    indices = np.clip(values01 * (_LUT_SIZE - 1) + 0.5, 0, _LUT_SIZE - 1).astype(np.uint8)
+    return lut[indices]
+
+
+def _resize_map(values, size):
+    if values.shape[::-1] == size:
+        return values
+    return np.asarray(Image.fromarray(values.astype(np.float32), mode='F').resize(size, Image.BILINEAR))
+
+
+def _colorbar(height, cmap, width=12, gap=8):
+    """White gap followed by a vertical colorbar (max at the top), 80% of the image height"""
+    bar_height = max(1, int(height * 0.8))
+    ramp = np.linspace(1.0, 0.0, bar_height, dtype=np.float32)[:, None].repeat(width, axis=1)
+    strip = np.full((height, gap + width + 1, 3), 255, dtype=np.uint8)
+    top = (height - bar_height) // 2
+    strip[top:top + bar_height, gap:gap + width] = apply_colormap(ramp, cmap)
+    strip[top:top + bar_height, gap + width] = 0
+    return strip
+
+
+def overlay_heatmap(image, heatmap=None, cmap='jet', symmetric=False,
+                    image_alpha=0.8, heatmap_alpha=0.6, colorbar=True):
+    """Blend a heatmap over an RGB image and return a uint8 HxWx3 array.
+
+    `heatmap` may be a 2-D attribution map (colored through `cmap`) or an
+    HxWx3 float image in [0, 1], which is blended as-is. With no heatmap the
+    original image is returned unchanged.
+    """
+    base = np.asarray(image.convert('RGB') if isinstance(image, Image.Image) else image)
+    if base.dtype != np.uint8:
+        base = np.clip(base * 255.0, 0, 255).astype(np.uint8)
+    if heatmap is None:
+        return base
+
+    height, width = base.shape[:2]
+    heatmap = np.asarray(heatmap, dtype=np.float32)
+    if heatmap.ndim == 3:
+        colored = np.stack([_resize_map(heatmap[..., c], (width, height)) for c in range(3)], axis=-1)
+        colored = np.clip(colored, 0.0, 1.0) * 255.0
+    else:
+        colored = apply_colormap(normalize_map(_resize_map(heatmap, (width, height)), symmetric), cmap)
+
+    # Same compositing as two imshow layers over a white axes background
+    blended = (heatmap_alpha * colored.astype(np.float32)
+               + (1.0 - heatmap_alpha) * (image_alpha * base.astype(np.float32) + (1.0 - image_alpha) * 255.0))
+    out = np.clip(blended + 0.5, 0, 255).astype(np.uint8)
+    if colorbar and heatmap.ndim == 2:
+        out = np.concatenate([out, _colorbar(height, cmap)], axis=1)
+    return out
+
+
+def encode_image(array, fmt='png', size=None):
+    """Encode a uint8 RGB array as PNG or WebP bytes, optionally scaled to `size` height"""
+    img = Image.fromarray(array)
+    if size and img.height != size:
+        img = img.resize((round(img.width * size / img.height), size), Image.BILINEAR)
+    buf = io.BytesIO()
+    if fmt == 'webp' and features.check('webp'):
+        img.save(buf, format='WEBP', quality=90, method=0)
+    else:
+        img.save(buf, format='PNG', compress_level=1)
+    return buf.getvalue()
+
+
+def image_format(fmt):
+    """Format actually produced by `encode_image` for a requested format"""
+    return 'webp' if fmt == 'webp' and features.check('webp') else 'png'
+
+
+def render_overlay_base64(image, heatmap=None, cmap='jet', symmetric=False, fmt='png', size=None):
+    """Overlay + encode in one call, returning a base64 string"""
+    array = overlay_heatmap(image, heatmap, cmap=cmap, symmetric=symmetric)
+    return base64.b64encode(encode_image(array, fmt, size)).decode()
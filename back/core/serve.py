@@ -0,0 +1,250 @@
+"""Pre-forked API workers sharing one copy of the model weights.
+
+Usage (from back/):
+    python -m core.serve --workers 4 --port 8000
+    python -m core.serve --workers 4 --model v2=models/v2.pth:models/v2_class_mapping.json
+    python -m core.serve --workers 4 --no-preload     # every worker loads its own copy (for comparison)
+
+`uvicorn api:app --workers N` starts N interpreters that each import api.py
+and load the checkpoint, so memory grows by a full model per worker. Here the
+parent loads, optimizes and warms up every model version once (the checkpoint
+is memory-mapped by core.model.load_model), moves the weights into shared
+memory, imports the XAI dependencies, binds the listening socket and only then
+forks. Workers map the same weight pages, run their own event loop on the
+shared socket and get cpu_count // workers intra-op threads each so they
+don't oversubscribe the cores.
+
+The parent restarts workers that die and logs per-worker RSS and PSS from
+/proc/<pid>/smaps_rollup. RSS counts shared pages in full for every process;
+PSS splits them between the processes mapping them, so the sum of PSS is the
+real footprint. Versions added later through POST /api/models are loaded by
+the one worker that handled the request; preload them here with --model.
+"""
+import gc
+import os
+import select
+import signal
+import socket
+import sys
+import time
+
+import torch
+
+SMAPS_FIELDS = {
+    'Rss': 'rss', 'Pss': 'pss', 'Shared_Clean': 'shared', 'Shared_Dirty': 'shared',
+    'Private_Clean': 'private', 'Private_Dirty': 'private', 'Swap': 'swap',
+}
+
+
+def memory_usage(pid=None):
+    """RSS / PSS / shared / private / swap of a process in MB (Linux only; None elsewhere)"""
+    pid = pid or os.getpid()
+    usage = {'rss': 0.0, 'pss': 0.0, 'shared': 0.0, 'private': 0.0, 'swap': 0.0}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                key = SMAPS_FIELDS.get(parts[0].rstrip(':'))
+                if key:
+                    usage[key] += int(parts[1]) / 1024
+    except FileNotFoundError:
+        # Kernels before 4.14 have no smaps_rollup: RSS only
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return {'rss': int(line.split()[1]) / 1024}
+        except FileNotFoundError:
+            return None
+    return {key: round(value, 1) for key, value in usage.items()}
+
+
+def parse_model_spec(spec):
+    """'name=checkpoint[:class_mapping]' -> (name, checkpoint, class_mapping)"""
+    name, _, paths = spec.partition('=')
+    if not name or not paths:
+        raise ValueError(f"Expected NAME=CHECKPOINT[:CLASS_MAPPING], got {spec!r}")
+    checkpoint, _, class_mapping = paths.partition(':')
+    return name, checkpoint, class_mapping or None
+
+
+def share_weights(version):
+    """Move a version's parameters and buffers into shared memory so forked workers never copy them"""
+    for module in {id(m): m for m in (version.model, version.inference_model)}.values():
+        if isinstance(module, torch.nn.Module):
+            module.share_memory()
+
+
+def preload(api, extra_models=()):
+    """Load every model version in this (parent) process"""
+    api.load_models()
+    for name, checkpoint, class_mapping in extra_models:
+        api.registry.register(api.registry.build(name, checkpoint, class_mapping=class_mapping))
+    for name in api.registry.status()['versions']:
+        share_weights(api.registry.get(name))
+    try:
+        # LIME segmentation; otherwise each worker imports scikit-image on its first LIME request
+        import skimage.segmentation  # noqa: F401
+    except ImportError:
+        pass
+    _release_free_memory()
+
+
+def _release_free_memory():
+    """Return the heap freed after loading/optimizing to the OS (glibc only) so it isn't inherited"""
+    gc.collect()
+    try:
+        import ctypes
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(index, sock, threads, ready_fd, preloaded, log_level):
+    """Child process: own intra-op threads, own event loop, shared socket"""
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    torch.set_num_threads(threads)
+    import uvicorn
+    import api
+    if not preloaded:
+        api.load_models()
+    os.write(ready_fd, f"{index}\n".encode())
+    os.close(ready_fd)
+    server = uvicorn.Server(uvicorn.Config(api.app, log_level=log_level))
+    server.run(sockets=[sock])
+
+
+def serve(host='0.0.0.0', port=8000, workers=2, threads=None, extra_models=(), preload_models=True,
+          memory_report_interval=300.0, log_level='info'):
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    # One thread while loading: the parent never starts an OpenMP pool that the forks would inherit broken
+    torch.set_num_threads(1)
+    import api
+    if preload_models:
+        started = time.perf_counter()
+        preload(api, extra_models)
+        print(f"Loaded {list(api.registry.status()['versions'])} in {time.perf_counter() - started:.1f}s "
+              f"(parent {memory_usage()})")
+    elif extra_models:
+        raise ValueError("--model needs the preloaded mode")
+
+    sock = bind_socket(host, port)
+    ready_r, ready_w = os.pipe()
+    # Keep the loaded objects out of the cyclic GC so its bookkeeping writes don't un-share their pages
+    gc.collect()
+    gc.freeze()
+
+    children = {}  # pid -> worker index
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            code = 0
+            try:
+                run_worker(index, sock, threads, ready_w, preload_models, log_level)
+            except BaseException as e:
+                print(f"Worker {index} failed: {e}", file=sys.stderr)
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = index
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for index in range(workers):
+        spawn(index)
+    print(f"Serving on {host}:{port} with {workers} workers x {threads} threads"
+          f" ({'shared preloaded weights' if preload_models else 'per-worker weights'})")
+
+    ready = set()
+    buffer = b''
+    next_report = None
+    while children:
+        try:
+            readable, _, _ = select.select([ready_r], [], [], 0.5)
+        except InterruptedError:
+            readable = []
+        if readable:
+            buffer += os.read(ready_r, 1024)
+            *lines, buffer = buffer.split(b'\n')
+            ready.update(int(line) for line in lines if line)
+            if len(ready) == workers and next_report is None:
+                print(f"All {workers} workers ready")
+                report_memory(children)
+                next_report = time.monotonic() + memory_report_interval
+
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            index = children.pop(pid)
+            if not stopping:
+                print(f"Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+                spawn(index)
+
+        if next_report is not None and memory_report_interval > 0 and time.monotonic() >= next_report:
+            report_memory(children)
+            next_report = time.monotonic() + memory_report_interval
+
+    sock.close()
+
+
+def report_memory(children):
+    """Per-worker memory plus totals; the PSS total is what the workers really use together"""
+    total_rss = total_pss = 0.0
+    for pid, index in sorted(children.items(), key=lambda item: item[1]):
+        usage = memory_usage(pid)
+        if not usage:
+            continue
+        total_rss += usage['rss']
+        total_pss += usage.get('pss', 0.0)
+        print(f"  worker {index} pid {pid}: " + ", ".join(f"{key} {value:.0f} MB" for key, value in usage.items()))
+    print(f"  total: rss {total_rss:.0f} MB, pss {total_pss:.0f} MB (parent pss {memory_usage().get('pss', 0):.0f} MB)")
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve the API from pre-forked workers with shared model weights')
+    parser.add_argument('--host', type=str, default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op threads per worker')
+    parser.add_argument('--model', type=str, action='append', default=[],
+                        help='Extra version to preload: NAME=CHECKPOINT[:CLASS_MAPPING] (repeatable)')
+    parser.add_argument('--no-preload', action='store_true', help='Each worker loads its own model copy')
+    parser.add_argument('--memory-report-interval', type=float, default=300.0,
+                        help='Seconds between per-worker memory reports (0 = only once workers are ready)')
+    parser.add_argument('--log-level', type=str, default='info')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.threads, [parse_model_spec(spec) for spec in args.model],
+          not args.no_preload, args.memory_report_interval, args.log_level)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from core.preprocess import decode_image, resize_center_crop
+
+
+def samples_fingerprint(samples):
+    """Hash of (path, size, mtime, label) for every sample; changes when the source folder does"""
+    digest = hashlib.sha1()
+    for path, label in samples:
+        stat = os.stat(path)
+        digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\0{label}\n".encode())
+    return digest.hexdigest()
+
+
+class ImageShard:
+    """Decoded images stored once as a memory-mapped uint8 array [N, size, size, 3].
+
+    The first epoch (or an explicit `build()`) decodes every image, resizes its
+    shorter side to `size` and center-crops it square. Later reads are slices
+    of the memory map, so epochs after the first skip JPEG decoding entirely.
+    `meta.json` records a fingerprint of the source files and is written last,
+    so an interrupted build or any added/removed/modified file triggers a rebuild.
+    """
+
+    def __init__(self, cache_dir, samples, size=256, fingerprint=None):
+        self.cache_dir = cache_dir
+        self.samples = samples
+        self.size = size
+        self.fingerprint = fingerprint
+        self.images_path = os.path.join(cache_dir, f'images_{size}.npy')
+        self.labels_path = os.path.join(cache_dir, f'labels_{size}.npy')
+        self.meta_path = os.path.join(cache_dir, f'meta_{size}.json')
+        self._images = None
+
+    def _current_fingerprint(self):
+        if self.fingerprint is None:
+            self.fingerprint = samples_fingerprint(self.samples)
+        return self.fingerprint
+
+    def is_valid(self):
+        if not (os.path.exists(self.meta_path) and os.path.exists(self.images_path)):
+            return False
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        return meta.get('fingerprint') == self._current_fingerprint() and meta.get('count') == len(self.samples)
+
+    def ensure(self, num_workers=None):
+        if not self.is_valid():
+            self.build(num_workers)
+        return self
+
+    def build(self, num_workers=None):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+        count = len(self.samples)
+        print(f"Building image shard for {count} images in {self.cache_dir}...")
+        images = np.lib.format.open_memmap(self.images_path, mode='w+', dtype=np.uint8,
+                                           shape=(count, self.size, self.size, 3))
+
+        def decode(index):
+            path, _ = self.samples[index]
+            image = resize_center_crop(decode_image(path, self.size), self.size, self.size)
+            images[index] = np.asarray(image)
+
+        # PIL releases the GIL while decoding
+        with ThreadPoolExecutor(num_workers or os.cpu_count()) as pool:
+            list(pool.map(decode, range(count)))
+        images.flush()
+        del images
+        np.save(self.labels_path, np.array([label for _, label in self.samples], dtype=np.int64))
+
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'fingerprint': self._current_fingerprint(), 'count': count, 'size': self.size}, f)
+        os.replace(tmp_path, self.meta_path)
+        self._images = None
+
+    @property
+    def images(self):
+        # Opened lazily so DataLoader workers each map the file instead of pickling the array
+        if self._images is None:
+            self._images = np.load(self.images_path, mmap_mode='r')
+        return self._images
+
+    def labels(self):
+        return np.load(self.labels_path)
+
+    def array(self, index):
+        """Zero-copy [size, size, 3] uint8 view of one image"""
+        return self.images[index]
+
+    def image(self, index):
+        return Image.fromarray(self.array(index))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_images'] = None
+        return state
@@ -0,0 +1,55 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class NotReady(Exception):
+    """Raised by endpoints that need the model before startup has finished"""
+
+    def __init__(self, retry_after=5):
+        super().__init__("Model is still loading")
+        self.retry_after = retry_after
+
+
+class StartupTracker:
+    """Records how long each startup phase took and whether the service is ready"""
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self.phases = {}
+        self.started = False
+        self.ready = False
+        self.error = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - started, 3)
+
+    def begin(self):
+        """Claim the loading job; False if another caller already started it"""
+        with self._lock:
+            if self.started:
+                return False
+            self.started = True
+            return True
+
+    def mark_ready(self):
+        self.phases['total_since_import'] = round(time.perf_counter() - self._origin, 3)
+        self.ready = True
+
+    def require_ready(self):
+        if not self.ready:
+            raise NotReady()
+
+    def status(self):
+        return {
+            'ready': self.ready,
+            'loading': self.started and not self.ready and self.error is None,
+            'error': self.error,
+            'phases_s': dict(self.phases),
+        }
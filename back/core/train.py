@@ -3,7 +3,15 @@ import torch.nn as nn
 import torch.optim as optim
 import os
 from core.dataset import get_dataloader, BrainTumorDataset
-from core.model import load_model, save_model
+from core.manifest import DatasetManifest
+from core.model import load_model
+from core.checkpoint import CheckpointManager, load_checkpoint, set_rng_state
+from core.distributed import (DistributedWeightedSampler, all_gather_cat, all_reduce_sum, barrier, main_first,
+                              setup as dist_setup, cleanup as dist_cleanup)
+from torch.nn.parallel import DistributedDataParallel
+from core.optimize import bf16_supported
+from core.preprocess import Preprocessor, IMAGENET_MEAN, IMAGENET_STD
+from core.augment import BatchAugment, ToUint8Tensor
 from torchvision import transforms
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, confusion_matrix
@@ -11,153 +19,271 @@ import glob
 from torch.utils.data import Subset
 from torch.utils.data import WeightedRandomSampler
 import numpy as np
+import json
+import time
+from contextlib import nullcontext
 
-def train_model(data_dir, num_epochs=5, batch_size=32, learning_rate=3e-4, num_samples=None, resume_from=None):
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    print(f"Using device: {device}")
+def build_transforms(batch_aug=False):
+    """Train (augmenting) and validation transforms.
 
-    # Define transformations
+    With batch_aug the train transform only yields fixed-size uint8 tensors;
+    augmentation then runs on whole batches through core.augment.BatchAugment.
+    """
+    if batch_aug:
+        return ToUint8Tensor(), Preprocessor()
     train_transform = transforms.Compose([
         transforms.RandomResizedCrop(224, scale=(0.85, 1.0)),
         transforms.RandomHorizontalFlip(p=0.5),
         transforms.RandomRotation(degrees=5),
         transforms.ColorJitter(brightness=0.1, contrast=0.1),
         transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-    ])
-    val_transform = transforms.Compose([
-        transforms.Resize(256),
-        transforms.CenterCrop(224),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD),
     ])
+    # Same Resize(256) + CenterCrop(224) pipeline the API serves with
+    val_transform = Preprocessor()
+    return train_transform, val_transform
+
+def split_indices(num_samples):
+    """Fixed train/val split of dataset indices (shared with export parity checks)"""
+    indices = list(range(num_samples))
+    return train_test_split(indices, test_size=0.15, shuffle=True, random_state=42)
+
+def train_model(data_dir, num_epochs=5, batch_size=32, learning_rate=3e-4, num_samples=None, resume_from=None,
+                cache_dir=None, batch_aug=False, num_workers=2, throughput=False, accum_steps=1,
+                log_path='models/train_log.jsonl', keep_last=3, distributed=False):
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    rank, world_size = 0, 1
+    if distributed:
+        # gloo DDP across CPU processes (launched by torchrun)
+        rank, world_size = dist_setup()
+        device = 'cpu'
+    main = rank == 0
+    print(f"Using device: {device}" + (f" (rank {rank}/{world_size})" if distributed else ""))
+
+    # Throughput mode: channels_last everywhere, bf16 autocast where the hardware runs it natively
+    use_bf16 = throughput and (device == 'cuda' or bf16_supported())
+    memory_format = torch.channels_last if throughput else torch.contiguous_format
+    if throughput and not use_bf16:
+        print("Throughput mode: no native bf16 on this CPU, keeping FP32 compute")
+    autocast = (lambda: torch.autocast(device_type=device, dtype=torch.bfloat16)) if use_bf16 else nullcontext
+
+    # Define transformations
+    train_transform, val_transform = build_transforms(batch_aug)
+    batch_augment = BatchAugment() if batch_aug else None
 
     # Load dataset and model
-    # Build dataset once, then split indices into train/val
-    full_dataset_for_split = BrainTumorDataset(data_dir=data_dir, transform=val_transform)
+    # Scan the folder once (cached manifest), then split indices into train/val
+    # (distributed: rank 0 writes the manifest/shard caches, the other ranks then reuse them)
+    with main_first():
+        manifest = DatasetManifest.load_or_build(data_dir)
+        full_dataset_for_split = BrainTumorDataset(data_dir=data_dir, transform=val_transform, cache_dir=cache_dir,
+                                                   manifest=manifest)
     num_samples = len(full_dataset_for_split)
-    indices = list(range(num_samples))
-    train_idx, val_idx = train_test_split(indices, test_size=0.15, shuffle=True, random_state=42)
+    train_idx, val_idx = split_indices(num_samples)
 
-    train_dataset = BrainTumorDataset(data_dir=data_dir, transform=train_transform)
-    val_dataset = BrainTumorDataset(data_dir=data_dir, transform=val_transform)
+    train_dataset = BrainTumorDataset(data_dir=data_dir, transform=train_transform, cache_dir=cache_dir,
+                                      manifest=manifest)
+    val_dataset = BrainTumorDataset(data_dir=data_dir, transform=val_transform, cache_dir=cache_dir,
+                                    manifest=manifest)
     train_subset = Subset(train_dataset, train_idx)
-    val_subset = Subset(val_dataset, val_idx)
+    # Each rank validates a disjoint slice; counts and predictions are reduced afterwards
+    val_subset = Subset(val_dataset, val_idx[rank::world_size])
+
+    # Labels straight from the manifest: no image decoding needed for sampler/class weights
+    label_tensor = torch.from_numpy(manifest.labels_array()[train_idx])
 
     # Build weighted sampler to upsample rare classes
-    with torch.no_grad():
-        train_labels = []
-        for idx in train_idx:
-            _, y = train_dataset[idx]
-            train_labels.append(int(y))
-        label_tensor = torch.tensor(train_labels)
-        class_sample_count = torch.bincount(label_tensor, minlength=full_dataset_for_split.num_classes).float()
-        weights_per_class = 1.0 / (class_sample_count + 1e-6)
-        samples_weight = weights_per_class[label_tensor]
+    class_sample_count = torch.bincount(label_tensor, minlength=full_dataset_for_split.num_classes).float()
+    weights_per_class = 1.0 / (class_sample_count + 1e-6)
+    samples_weight = weights_per_class[label_tensor]
+    if distributed:
+        sampler = DistributedWeightedSampler(samples_weight, rank=rank, world_size=world_size, seed=42)
+    else:
         sampler = WeightedRandomSampler(weights=samples_weight, num_samples=len(samples_weight), replacement=True)
 
-    train_loader = torch.utils.data.DataLoader(train_subset, batch_size=batch_size, sampler=sampler, num_workers=2, pin_memory=False)
-    val_loader = torch.utils.data.DataLoader(val_subset, batch_size=batch_size, shuffle=False, num_workers=2, pin_memory=False)
+    train_loader = torch.utils.data.DataLoader(train_subset, batch_size=batch_size, sampler=sampler, num_workers=num_workers,
+                                               pin_memory=False, persistent_workers=num_workers > 0)
+    val_loader = torch.utils.data.DataLoader(val_subset, batch_size=batch_size, shuffle=False, num_workers=num_workers,
+                                             pin_memory=False)
     
     # Get actual number of classes from dataset
     num_classes = full_dataset_for_split.num_classes
     model = load_model(num_classes=num_classes, device=device)
     
-    # Resume from checkpoint if specified
-    start_epoch = 0
-    if resume_from and os.path.exists(resume_from):
-        print(f"Resuming training from {resume_from}")
-        checkpoint = torch.load(resume_from, map_location=device)
-        model.load_state_dict(checkpoint)
-        # Extract epoch number from filename if possible
-        if 'epoch' in resume_from:
-            try:
-                start_epoch = int(resume_from.split('epoch')[-1].split('.')[0])
-                print(f"Resuming from epoch {start_epoch}")
-            except:
-                print("Could not extract epoch number from filename")
-    
     # Save class mapping for API
-    os.makedirs('models', exist_ok=True)
-    full_dataset_for_split.save_class_mapping('models/class_mapping.json')
+    if main:
+        os.makedirs('models', exist_ok=True)
+        full_dataset_for_split.save_class_mapping('models/class_mapping.json')
 
     # Define loss and optimizer
     # Compute class weights to handle imbalance
-    with torch.no_grad():
-        label_list = []
-        for i in train_idx:
-            _, y = train_dataset[i]
-            label_list.append(int(y))
-        counts = torch.bincount(torch.tensor(label_list), minlength=num_classes).float()
-        weights = (counts.sum() / (counts + 1e-6))
-        weights = weights / weights.mean()
+    counts = torch.bincount(label_tensor, minlength=num_classes).float()
+    weights = (counts.sum() / (counts + 1e-6))
+    weights = weights / weights.mean()
     criterion = nn.CrossEntropyLoss(weight=weights.to(device))
     optimizer = optim.AdamW(model.parameters(), lr=learning_rate, weight_decay=1e-4)
     scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=num_epochs)
     
-    print(f"Training with {num_classes} classes")
-    print(f"Class distribution: {counts.tolist()}")
-    print(f"Class weights: {weights.tolist()}")
+    if main:
+        print(f"Training with {num_classes} classes")
+        print(f"Class distribution: {counts.tolist()}")
+        print(f"Class weights: {weights.tolist()}")
 
     # Training
     best_val_acc = 0.0
-    best_path = 'models/brain_tumor_model_best.pth'
     epochs_no_improve = 0
     patience = 3
+    checkpoints = CheckpointManager('models', keep_last=keep_last)
+
+    # Resume from checkpoint if specified ('auto' = newest full checkpoint in models/checkpoints)
+    start_epoch = 0
+    if resume_from == 'auto':
+        resume_from = checkpoints.latest()
+    if resume_from and os.path.exists(resume_from):
+        print(f"Resuming training from {resume_from}")
+        checkpoint = load_checkpoint(resume_from, map_location=device)
+        model.load_state_dict(checkpoint['model'])
+        start_epoch = checkpoint['epoch']
+        if checkpoint.get('optimizer') is not None:
+            optimizer.load_state_dict(checkpoint['optimizer'])
+            scheduler.load_state_dict(checkpoint['scheduler'])
+            set_rng_state(checkpoint['rng'])
+            best_val_acc = checkpoint.get('best_val_acc', 0.0)
+            epochs_no_improve = checkpoint.get('epochs_no_improve', 0)
+        else:
+            # Weights-only file: optimizer, scheduler and RNG start fresh
+            print("Legacy checkpoint (weights only), optimizer state not restored")
+        print(f"Resuming from epoch {start_epoch}")
+
+    model = model.to(memory_format=memory_format)
+    base_model = model
+    if distributed:
+        model = DistributedDataParallel(model)
     for epoch in range(start_epoch, num_epochs):
+        if distributed:
+            sampler.set_epoch(epoch)
         model.train()
-        running_loss = 0.0
-        correct = 0
+        # Metrics stay on the device; the only sync is at the end of the epoch
+        running_loss = torch.zeros((), device=device)
+        correct = torch.zeros((), dtype=torch.long, device=device)
         total = 0
-        for inputs, labels in train_loader:
-            inputs, labels = inputs.to(device), labels.to(device)
+        data_time = 0.0
+        compute_time = 0.0
+        epoch_start = time.perf_counter()
+        step_start = epoch_start
+        optimizer.zero_grad(set_to_none=True)
+        for step, (inputs, labels) in enumerate(train_loader):
+            data_ready = time.perf_counter()
+            data_time += data_ready - step_start
+            inputs, labels = inputs.to(device, non_blocking=True), labels.to(device, non_blocking=True)
+            if batch_augment is not None:
+                # uint8 batch -> augmented, normalized float batch
+                inputs = batch_augment(inputs)
+            inputs = inputs.contiguous(memory_format=memory_format)
 
             # MixUp augmentation
             use_mixup = np.random.rand() < 0.5
-            if use_mixup:
-                lam = np.random.beta(0.4, 0.4)
-                index = torch.randperm(inputs.size(0)).to(device)
-                mixed_inputs = lam * inputs + (1 - lam) * inputs[index, :]
-                targets_a, targets_b = labels, labels[index]
-                optimizer.zero_grad()
-                outputs = model(mixed_inputs)
-                loss = lam * criterion(outputs, targets_a) + (1 - lam) * criterion(outputs, targets_b)
-            else:
-                optimizer.zero_grad()
-                outputs = model(inputs)
-                loss = criterion(outputs, labels)
-            loss.backward()
-            optimizer.step()
-
-            running_loss += loss.item()
-            _, predicted = torch.max(outputs.data, 1)
+            # DDP: skip the gradient all-reduce on accumulation-only steps
+            stepping = (step + 1) % accum_steps == 0 or step + 1 == len(train_loader)
+            no_sync = model.no_sync if distributed and not stepping else nullcontext
+            with no_sync():
+                with autocast():
+                    if use_mixup:
+                        lam = np.random.beta(0.4, 0.4)
+                        index = torch.randperm(inputs.size(0)).to(device)
+                        mixed_inputs = lam * inputs + (1 - lam) * inputs[index, :]
+                        targets_a, targets_b = labels, labels[index]
+                        outputs = model(mixed_inputs)
+                        loss = lam * criterion(outputs, targets_a) + (1 - lam) * criterion(outputs, targets_b)
+                    else:
+                        outputs = model(inputs)
+                        loss = criterion(outputs, labels)
+                # Gradient accumulation: effective batch = batch_size * accum_steps (* world_size)
+                (loss / accum_steps).backward()
+            if stepping:
+                optimizer.step()
+                optimizer.zero_grad(set_to_none=True)
+
+            running_loss += loss.detach()
+            correct += (outputs.detach().argmax(dim=1) == labels).sum()
             total += labels.size(0)
-            correct += (predicted == labels).sum().item()
+            step_start = time.perf_counter()
+            compute_time += step_start - data_ready
 
         scheduler.step()
-        train_acc = 100 * correct / total
+        if device == 'cuda':
+            torch.cuda.synchronize()
+        train_time = time.perf_counter() - epoch_start
+        # One reduction for loss, correct and sample counts across ranks
+        totals = all_reduce_sum(torch.stack([running_loss.float(), correct.float(),
+                                             torch.tensor(float(total), device=device)]).cpu())
+        train_loss = totals[0].item() / (len(train_loader) * world_size)
+        total = int(totals[2].item())
+        train_acc = 100 * totals[1].item() / total
 
         # Validation
         model.eval()
-        val_correct = 0
+        val_correct = torch.zeros((), dtype=torch.long, device=device)
         val_total = 0
         all_preds = []
         all_targets = []
-        with torch.no_grad():
+        val_start = time.perf_counter()
+        with torch.no_grad(), autocast():
             for v_inputs, v_labels in val_loader:
                 v_inputs, v_labels = v_inputs.to(device), v_labels.to(device)
-                v_outputs = model(v_inputs)
-                _, v_pred = torch.max(v_outputs.data, 1)
+                v_outputs = model(v_inputs.contiguous(memory_format=memory_format))
+                v_pred = v_outputs.argmax(dim=1)
                 val_total += v_labels.size(0)
-                val_correct += (v_pred == v_labels).sum().item()
-                all_preds.append(v_pred.cpu())
-                all_targets.append(v_labels.cpu())
-        val_acc = 100 * val_correct / val_total
-        print(f"Epoch {epoch+1}/{num_epochs} | Train Acc: {train_acc:.2f}% | Val Acc: {val_acc:.2f}% | Loss: {running_loss/len(train_loader):.4f}")
+                val_correct += (v_pred == v_labels).sum()
+                all_preds.append(v_pred)
+                all_targets.append(v_labels)
+        val_counts = all_reduce_sum(torch.stack([val_correct.cpu(), torch.tensor(val_total)]))
+        val_acc = 100 * val_counts[0].item() / val_counts[1].item()
+        val_time = time.perf_counter() - val_start
+        empty = torch.empty(0, dtype=torch.long)
+        y_true = all_gather_cat(torch.cat(all_targets).cpu() if all_targets else empty).numpy()
+        y_pred = all_gather_cat(torch.cat(all_preds).cpu() if all_preds else empty).numpy()
+
+        is_best = val_acc > best_val_acc
+        if is_best:
+            best_val_acc = val_acc
+            epochs_no_improve = 0
+        else:
+            epochs_no_improve += 1
+        stop = epochs_no_improve >= patience
+        if not main:
+            # Early stopping decision is identical on every rank (val_acc is global)
+            if stop:
+                break
+            continue
+
+        print(f"Epoch {epoch+1}/{num_epochs} | Train Acc: {train_acc:.2f}% | Val Acc: {val_acc:.2f}% | Loss: {train_loss:.4f}")
+        print(f"  {total / train_time:.1f} img/s | data wait {data_time:.1f}s | compute {compute_time:.1f}s")
+
+        # Per-epoch timing log next to the checkpoints (one JSON object per line)
+        if log_path:
+            os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+            with open(log_path, 'a') as f:
+                f.write(json.dumps({
+                    'epoch': epoch + 1,
+                    'train_loss': round(train_loss, 5),
+                    'train_acc': round(train_acc, 3),
+                    'val_acc': round(val_acc, 3),
+                    'images': total,
+                    'images_per_sec': round(total / train_time, 2),
+                    'data_wait_s': round(data_time, 3),
+                    'compute_s': round(compute_time, 3),
+                    'epoch_s': round(train_time, 3),
+                    'val_s': round(val_time, 3),
+                    'batch_size': batch_size,
+                    'accum_steps': accum_steps,
+                    'world_size': world_size,
+                    'bf16': use_bf16,
+                    'channels_last': throughput,
+                    'timestamp': time.time(),
+                }) + '\n')
 
         # Metrics per class
-        y_true = torch.cat(all_targets).numpy()
-        y_pred = torch.cat(all_preds).numpy()
         report = classification_report(y_true, y_pred, digits=3)
         print(report)
         # Save confusion matrix image
@@ -173,32 +299,23 @@ def train_model(data_dir, num_epochs=5, batch_size=32, learning_rate=3e-4, num_s
         except Exception:
             pass
 
-        # Save best
-        os.makedirs('models', exist_ok=True)
-        if val_acc > best_val_acc:
-            best_val_acc = val_acc
-            save_model(model, best_path)
-            epochs_no_improve = 0
-        else:
-            epochs_no_improve += 1
-            if epochs_no_improve >= patience:
-                print(f"Early stopping at epoch {epoch+1} (no improvement for {patience} epochs).")
-                break
+        # Checkpoint (rank 0 only): snapshot on this thread, write in the background
+        state = checkpoints.snapshot(base_model, optimizer, scheduler, epoch=epoch + 1, val_acc=val_acc,
+                                     best_val_acc=best_val_acc, epochs_no_improve=epochs_no_improve)
+        checkpoints.save(state, is_best=is_best)
+        if stop:
+            print(f"Early stopping at epoch {epoch+1} (no improvement for {patience} epochs).")
+            break
 
-        # Save model after each epoch
-        os.makedirs('models', exist_ok=True)
-        save_model(model, f'models/brain_tumor_model_epoch{epoch+1}.pth')
-        # Update the main model file
-        save_model(model, 'models/brain_tumor_model.pth')
-
-    # Save final and copy best to main
-    os.makedirs('models', exist_ok=True)
-    save_model(model, 'models/brain_tumor_model.pth')
-    if os.path.exists(best_path):
-        # Overwrite main with best
-        import shutil
-        shutil.copyfile(best_path, 'models/brain_tumor_model.pth')
-        print(f"Best model (Val Acc: {best_val_acc:.2f}%) copied to models/brain_tumor_model.pth")
+    # Wait for pending writes, then make the best weights the main model file
+    checkpoints.wait()
+    if main and os.path.exists(checkpoints.best_path):
+        checkpoints.save_weights(torch.load(checkpoints.best_path, map_location='cpu', weights_only=True))
+        print(f"Best model (Val Acc: {best_val_acc:.2f}%) copied to {checkpoints.main_path}")
+    checkpoints.close()
+    if distributed:
+        barrier()
+        dist_cleanup()
 
 if __name__ == "__main__":
     import argparse
@@ -207,7 +324,24 @@ if __name__ == "__main__":
     parser.add_argument('--epochs', type=int, default=5)
     parser.add_argument('--batch', type=int, default=32)
     parser.add_argument('--lr', type=float, default=3e-4)
-    parser.add_argument('--resume', type=str, default=None, help='Path to checkpoint to resume from')
+    parser.add_argument('--resume', type=str, default=None,
+                        help="Checkpoint to resume from ('auto' = newest in models/checkpoints)")
+    parser.add_argument('--keep-last', type=int, default=3, help='Full epoch checkpoints to keep')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='Decode images once into a memory-mapped shard here and reuse it across epochs')
+    parser.add_argument('--batch-aug', action='store_true',
+                        help='Augment whole uint8 batches as tensors instead of per image in the workers')
+    parser.add_argument('--workers', type=int, default=2, help='DataLoader worker processes')
+    parser.add_argument('--throughput', action='store_true',
+                        help='channels_last and bf16 autocast (when the hardware supports bf16)')
+    parser.add_argument('--accum-steps', type=int, default=1,
+                        help='Gradient accumulation steps (effective batch = batch * accum-steps)')
+    parser.add_argument('--log', type=str, default='models/train_log.jsonl', help='Per-epoch JSON log')
+    parser.add_argument('--distributed', action='store_true',
+                        help='Data-parallel over CPU processes (gloo); launch with torchrun --nproc_per_node=N')
     args = parser.parse_args()
-    train_model(args.data, num_epochs=args.epochs, batch_size=args.batch, learning_rate=args.lr, resume_from=args.resume)
+    train_model(args.data, num_epochs=args.epochs, batch_size=args.batch, learning_rate=args.lr, resume_from=args.resume,
+                cache_dir=args.cache_dir, batch_aug=args.batch_aug, num_workers=args.workers,
+                throughput=args.throughput, accum_steps=args.accum_steps, log_path=args.log,
+                keep_last=args.keep_last, distributed=args.distributed)
 
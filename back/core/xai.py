@@ -1,160 +1,121 @@
 import torch
-import numpy as np
-import matplotlib.pyplot as plt
-from captum.attr import LayerGradCam
-from captum.attr import visualization as viz
+from core import config
+from core.lime_engine import LimeEngine
+from core.attribution import AttributionEngine
 
-try:
-    import shap
-    _HAS_SHAP = True
-except Exception:
-    shap = None
-    _HAS_SHAP = False
-
-try:
-    import lime
-    from lime import lime_image
-    _HAS_LIME = True
-except Exception:
-    lime = None
-    lime_image = None
-    _HAS_LIME = False
+# SHAP and LIME are implemented in core.attribution / core.lime_engine and need no extra package
+_HAS_SHAP = True
+_HAS_LIME = True
 
 class XAIManager:
     def __init__(self, model, device='cuda' if torch.cuda.is_available() else 'cpu'):
         self.model = model
         self.device = device
         self.model.eval()
+        self.lime_engine = LimeEngine(model, device, batch_size=config.LIME_BATCH_SIZE)
+        self.attribution_engine = AttributionEngine(
+            model, device,
+            internal_batch_size=config.ATTRIBUTION_BATCH_SIZE,
+            max_memory_mb=config.ATTRIBUTION_MAX_MEMORY_MB,
+        )
 
-    def grad_cam(self, input_tensor, target_class=None):
-        """Простая рабочая реализация Grad-CAM"""
-        try:
-            # Создаем новый тензор с градиентами
-            input_tensor = input_tensor.clone().detach().requires_grad_(True)
-            
-            # Получаем предсказание
-            if target_class is None:
-                with torch.no_grad():
-                    output = self.model(input_tensor)
-                    target_class = output.argmax(dim=1).item()
-            
-            # Простая реализация Grad-CAM без Captum
-            self.model.eval()
-            input_tensor.requires_grad_(True)
-            
-            # Forward pass
+    GRADIENT_METHODS = ('gradcam', 'shap')
+
+    def analyze(self, input_tensor, methods=GRADIENT_METHODS, target_class=None):
+        """Prediction + all requested gradient maps.
+
+        Prediction and Grad-CAM come from one forward and one backward pass;
+        SHAP reuses that pass's target class and runs its batched path integral.
+        """
+        # Only Grad-CAM backpropagates through this pass; SHAP's engine runs its own
+        needs_grad = 'gradcam' in methods
+        input_tensor = input_tensor.clone().detach().requires_grad_(needs_grad)
+        self.model.eval()
+
+        # Forward pass
+        with torch.set_grad_enabled(needs_grad):
             output = self.model(input_tensor)
-            target_score = output[0, target_class]
-            
-            # Backward pass
-            target_score.backward()
-            
-            # Получаем градиенты из последнего conv слоя
-            gradients = input_tensor.grad.data
-            
+        probabilities = torch.softmax(output.detach(), dim=1)
+        if target_class is None:
+            target_class = output.argmax(dim=1).item()
+
+        maps = {}
+        details = {}
+        if 'gradcam' in methods:
+            # Backward pass: gradient w.r.t. the input only, model .grad buffers stay untouched
+            gradients, = torch.autograd.grad(output[0, target_class], input_tensor)
             # Создаем простую тепловую карту
-            grad_cam = torch.mean(gradients, dim=1, keepdim=True)
-            grad_cam = torch.relu(grad_cam)
-            
+            heatmap = torch.relu(torch.mean(gradients, dim=1, keepdim=True))
             # Нормализуем
-            grad_cam = grad_cam / (grad_cam.max() + 1e-8)
-            
-            return grad_cam, target_class
-            
+            maps['gradcam'] = heatmap / (heatmap.max() + 1e-8)
+        if 'shap' in methods:
+            maps['shap'], details['shap'] = self._shap_values(input_tensor, target_class)
+
+        return {
+            'logits': output.detach(),
+            'probabilities': probabilities,
+            'target_class': target_class,
+            'maps': maps,
+            'details': details,
+        }
+
+    def _shap_values(self, input_tensor, target_class):
+        """SHAP attributions (GradientSHAP or Integrated Gradients), normalized for display"""
+        if config.SHAP_METHOD == 'integrated_gradients':
+            attributions, delta = self.attribution_engine.integrated_gradients(
+                input_tensor, target_class, n_steps=config.SHAP_N_STEPS
+            )
+        else:
+            attributions, delta = self.attribution_engine.gradient_shap(
+                input_tensor, target_class, n_samples=config.SHAP_N_SAMPLES
+            )
+        shap_values = attributions.abs()
+        return shap_values / (shap_values.max() + 1e-8), {
+            'attribution_method': config.SHAP_METHOD,
+            'convergence_delta': round(delta, 6),
+        }
+
+    def grad_cam(self, input_tensor, target_class=None):
+        """Простая рабочая реализация Grad-CAM"""
+        try:
+            result = self.analyze(input_tensor, ('gradcam',), target_class)
+            return result['maps']['gradcam'], result['target_class']
         except Exception as e:
             print(f"Grad-CAM error: {e}")
             return None, target_class
 
     def shap_explain(self, input_tensor, target_class=None):
-        """Простая рабочая реализация SHAP"""
+        """SHAP через батчевый AttributionEngine (core.attribution)"""
         try:
-            # Получаем предсказание
-            if target_class is None:
-                with torch.no_grad():
-                    output = self.model(input_tensor)
-                    target_class = output.argmax(dim=1).item()
-            
-            # Простая реализация SHAP - используем градиенты
-            input_tensor = input_tensor.clone().detach().requires_grad_(True)
-            
-            # Forward pass
-            output = self.model(input_tensor)
-            target_score = output[0, target_class]
-            
-            # Backward pass
-            target_score.backward()
-            
-            # Получаем градиенты как SHAP значения
-            shap_values = input_tensor.grad.data.abs()
-            
-            # Нормализуем
-            shap_values = shap_values / (shap_values.max() + 1e-8)
-            
-            return shap_values, target_class
-            
+            result = self.analyze(input_tensor, ('shap',), target_class)
+            return result['maps']['shap'], result['target_class']
         except Exception as e:
             print(f"SHAP error: {e}")
             return None, target_class
 
-    def lime_explain(self, input_tensor, target_class=None):
-        """Настоящая реализация LIME с правильной обработкой"""
-        if not _HAS_LIME:
-            raise ImportError("LIME is not installed")
-        
+    def lime_explain(self, input_tensor, target_class=None, num_samples=None, num_features=None, image_key=None):
+        """LIME через батчевый движок (core.lime_engine) -> (map, target_class, details)"""
         try:
-            # Денормализуем изображение
-            img_np = self._denormalize_image(input_tensor.squeeze().cpu().numpy())
-            
-            # Создаем объяснитель
-            explainer = lime_image.LimeImageExplainer()
-            
-            # Функция предсказания для LIME
-            def predict_fn(images):
-                images_tensor = torch.from_numpy(images.transpose(0, 3, 1, 2)).float().to(self.device)
-                images_tensor = self._normalize_tensor(images_tensor)
-                
-                with torch.no_grad():
-                    outputs = self.model(images_tensor)
-                    return outputs.cpu().numpy()
-            
-            # Получаем объяснение
-            explanation = explainer.explain_instance(
-                img_np, 
-                predict_fn, 
-                top_labels=1, 
-                hide_color=0, 
-                num_samples=100  # Больше samples для лучшего качества
-            )
-            
-            # Получаем маску для целевого класса
-            if target_class is None:
-                target_class = explanation.top_labels[0]
-            
-            lime_values, mask = explanation.get_image_and_mask(
-                target_class, 
-                positive_only=True, 
-                num_features=10, 
-                hide_rest=False
+            return self.lime_engine.explain(
+                input_tensor,
+                target_class,
+                num_samples=min(num_samples or config.LIME_NUM_SAMPLES, config.LIME_MAX_SAMPLES),
+                num_features=num_features or config.LIME_NUM_FEATURES,
+                image_key=image_key,
             )
-            
-            return lime_values, target_class
-            
         except Exception as e:
             print(f"LIME error: {e}")
-            return None, target_class
-
-    def _denormalize_image(self, img_tensor):
-        """Денормализация изображения"""
-        mean = np.array([0.485, 0.456, 0.406])
-        std = np.array([0.229, 0.224, 0.225])
-        
-        img = img_tensor.transpose(1, 2, 0)
-        img = img * std + mean
-        img = np.clip(img, 0, 1)
-        return img
+            return None, target_class, {}
 
-    def _normalize_tensor(self, tensor):
-        """Нормализация тензора"""
-        mean = torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1).to(tensor.device)
-        std = torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1).to(tensor.device)
-        return (tensor - mean) / std
\ No newline at end of file
+    def lime_progressive(self, input_tensor, target_class=None, num_features=None, round_samples=None,
+                         max_samples=None, image_key=None):
+        """Generator of progressively refined LIME maps (LimeEngine.explain_progressive); errors propagate"""
+        return self.lime_engine.explain_progressive(
+            input_tensor,
+            target_class,
+            num_features=num_features or config.LIME_NUM_FEATURES,
+            round_samples=min(round_samples or config.LIME_ROUND_SAMPLES, config.LIME_MAX_SAMPLES),
+            max_samples=min(max_samples or config.LIME_MAX_SAMPLES, config.LIME_MAX_SAMPLES),
+            patience=config.LIME_PATIENCE,
+            image_key=image_key,
+        )
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import `core.*` the same way api.py does, from back/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
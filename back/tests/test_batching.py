@@ -0,0 +1,49 @@
+import asyncio
+
+import torch
+
+from core.batching import MicroBatcher
+
+
+class RecordingModel:
+    """Returns its input as logits and remembers every batch size"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, batch):
+        self.batch_sizes.append(len(batch))
+        return batch
+
+
+def one_hot(index, size=8):
+    # Large logit, so softmax keeps the row's argmax at `index`
+    row = torch.zeros(1, size)
+    row[0, index] = 20.0
+    return row
+
+
+def test_rows_go_back_to_their_callers_and_full_batches_flush():
+    model = RecordingModel()
+    batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=50)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(one_hot(i)) for i in range(6)))
+
+    rows = asyncio.run(main())
+    assert [int(row.argmax()) for row in rows] == list(range(6))
+    # The first 4 go out as soon as the batch is full, the rest once max_wait_ms passed
+    assert model.batch_sizes == [4, 2]
+    assert batcher.stats()['requests'] == 6
+
+
+def test_lone_request_flushes_after_max_wait():
+    model = RecordingModel()
+    batcher = MicroBatcher(model, max_batch_size=16, max_wait_ms=10)
+
+    async def main():
+        return await asyncio.wait_for(batcher.submit(one_hot(3)), 1.0)
+
+    row = asyncio.run(main())
+    assert int(row.argmax()) == 3
+    assert model.batch_sizes == [1]
@@ -0,0 +1,27 @@
+import asyncio
+
+from core.cache import ResultCache
+
+
+def test_cancelled_leader_does_not_cancel_coalesced_waiters():
+    cache = ResultCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def main():
+        leader = asyncio.ensure_future(cache.get_or_compute("key", compute))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.ensure_future(cache.get_or_compute("key", compute)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(*waiters)
+
+    results = asyncio.run(main())
+    # One waiter recomputed after the leader was cancelled; the others coalesced onto it
+    assert results == [2, 2, 2]
+    assert len(calls) == 2
+    assert cache.stats()['inflight'] == 0
@@ -0,0 +1,31 @@
+import asyncio
+import threading
+
+from core.executor import BoundedExecutor
+
+
+def test_cancelled_queued_run_releases_its_slot():
+    executor = BoundedExecutor("test", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def main():
+        running = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        try:
+            for _ in range(3):
+                queued = asyncio.ensure_future(executor.run(lambda: None))
+                await asyncio.sleep(0.05)
+                assert executor.stats()['queued'] == 1
+                queued.cancel()
+                await asyncio.sleep(0.05)
+                assert executor.stats()['queued'] == 0
+        finally:
+            release.set()
+            await running
+
+    asyncio.run(main())
+    stats = executor.stats()
+    assert stats['queued'] == 0
+    assert stats['active'] == 0
+    assert executor._pending == 0
+    executor.shutdown()
@@ -0,0 +1,31 @@
+import asyncio
+
+from core.jobs import JobQueue, JobStore
+
+
+def handler(job, contents):
+    if job['method'] == 'broken':
+        raise ValueError("no such method")
+    return {'method': job['method'], 'size': len(contents)}
+
+
+def test_submitted_jobs_end_done_or_failed(tmp_path):
+    store = JobStore(str(tmp_path))
+    queue = JobQueue(store, handler, poll_interval=0.05)
+    queue.start()
+    try:
+        done_id = queue.submit('digest-a', b'12345', 'gradcam', {})
+        failed_id = queue.submit('digest-b', b'xx', 'broken', {})
+
+        async def main():
+            return await queue.wait(done_id, 5.0), await queue.wait(failed_id, 5.0)
+
+        done, failed = asyncio.run(main())
+        assert done['status'] == 'done'
+        assert store.result(done_id) == {'method': 'gradcam', 'size': 5}
+        assert failed['status'] == 'failed'
+        assert failed['error'] == "no such method"
+        assert store.stats()['queued'] == 0
+    finally:
+        queue.stop()
+        store.close()
@@ -1,26 +1,16 @@
-import torch
-import matplotlib.pyplot as plt
-from PIL import Image
 import numpy as np
-from torchvision import transforms
+from core.preprocess import Preprocessor, IMAGENET_MEAN, IMAGENET_STD
 
 
 def load_image(image_path):
     """Loads an image and converts it to a tensor"""
-    img = Image.open(image_path).convert('RGB')
-    transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-    ])
-    img_tensor = transform(img).unsqueeze(0)
-    return img_tensor
+    return Preprocessor()(image_path).unsqueeze(0)
 
 
 def denormalize(tensor):
     """Denormalizes a tensor for visualization"""
-    mean = np.array([0.485, 0.456, 0.406])
-    std = np.array([0.229, 0.224, 0.225])
+    mean = np.array(IMAGENET_MEAN)
+    std = np.array(IMAGENET_STD)
     tensor = tensor.squeeze().cpu().numpy().transpose(1, 2, 0)
     tensor = std * tensor + mean
     tensor = np.clip(tensor, 0, 1)
@@ -29,6 +19,7 @@ def denormalize(tensor):
 
 def plot_predictions(image, pred_class, classes):
     """Displays the image with the predicted class"""
+    import matplotlib.pyplot as plt
     plt.imshow(image)
     plt.title(f"Predicted class: {classes[pred_class]}")
     plt.axis('off')
@@ -18,6 +18,35 @@ export const predictImage = async (file, method = 'gradcam') => {
   return response.data
 }
 
+// Sends all files in one request; the server streams one JSON line per file
+// as soon as its prediction is ready, so onResult fires in completion order.
+export const predictBatch = async (files, onResult) => {
+  const formData = new FormData()
+  files.forEach((file) => formData.append('files', file))
+
+  const response = await fetch(`${API_BASE_URL}/api/predict/batch`, {
+    method: 'POST',
+    body: formData,
+  })
+  if (!response.ok) {
+    const body = await response.json().catch(() => ({}))
+    throw new Error(body.detail || `Batch request failed (${response.status})`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    const lines = buffer.split('\n')
+    buffer = lines.pop()
+    lines.filter((line) => line.trim()).forEach((line) => onResult(JSON.parse(line)))
+  }
+  if (buffer.trim()) onResult(JSON.parse(buffer))
+}
+
 export const getXAIExplanation = async (file, method = 'gradcam', predictedClass = null) => {
   const formData = new FormData()
   formData.append('file', file)
@@ -30,6 +59,19 @@ export const getXAIExplanation = async (file, method = 'gradcam', predictedClass
   return response.data
 }
 
+// Prediction and explanations from a single forward/backward pass on the server
+export const analyzeImage = async (file, methods = ['gradcam'], predictedClass = null) => {
+  const formData = new FormData()
+  formData.append('file', file)
+  formData.append('methods', methods.join(','))
+  if (predictedClass !== null) {
+    formData.append('predicted_class', predictedClass)
+  }
+
+  const response = await api.post('/api/analyze', formData)
+  return response.data
+}
+
 export const getHealthStatus = async () => {
   const response = await api.get('/health')
   return response.data
@@ -1,10 +1,10 @@
 import { useRef, useState } from 'react'
 import useAppStore from '../store/useAppStore'
-import { predictImage } from '../api/api'
+import { predictBatch } from '../api/api'
 
 export default function BatchUpload() {
   const inputRef = useRef(null)
-  const { selectedMethod, addBatchResult, resetBatch, setError, setIsLoading } = useAppStore()
+  const { addBatchResult, resetBatch, setError, setIsLoading } = useAppStore()
   const [progress, setProgress] = useState({ done: 0, total: 0 })
 
   const handlePick = () => inputRef.current?.click()
@@ -15,17 +15,15 @@ export default function BatchUpload() {
     resetBatch()
     setProgress({ done: 0, total: list.length })
     setIsLoading(true)
+    let done = 0
     try {
-      for (let i = 0; i < list.length; i++) {
-        const f = list[i]
-        try {
-          const res = await predictImage(f, selectedMethod)
-          addBatchResult({ name: f.name, ...res })
-        } catch (e) {
-          addBatchResult({ name: f.name, error: e?.response?.data?.detail || 'Failed' })
-        }
-        setProgress({ done: i + 1, total: list.length })
-      }
+      await predictBatch(list, ({ index, filename, ...res }) => {
+        addBatchResult({ name: list[index]?.name || filename, ...res })
+        done += 1
+        setProgress({ done, total: list.length })
+      })
+    } catch (e) {
+      setError(e?.message || 'Batch prediction failed')
     } finally {
       setIsLoading(false)
     }
@@ -2,7 +2,7 @@ import { useState, useCallback, useRef, useEffect, useId } from 'react'
 import { UploadCloud, X, Loader2, Play, Image as ImageIcon } from 'lucide-react'
 import { useNavigate } from 'react-router-dom'
 import useAppStore from '../store/useAppStore'
-import { predictImage, getXAIExplanation } from '../api/api'
+import { analyzeImage } from '../api/api'
 
 export default function ImageUpload() {
   const [dragActive, setDragActive] = useState(false)
@@ -89,11 +89,13 @@ export default function ImageUpload() {
     setError(null)
 
     try {
-      const predResult = await predictImage(file, selectedMethod)
+      const { explanations, explained_class, ...predResult } = await analyzeImage(file, [selectedMethod])
       setPredictionResult(predResult)
-
-      const xaiResult = await getXAIExplanation(file, selectedMethod, predResult.predicted_class)
-      setXaiResult(xaiResult)
+      setXaiResult({
+        method: selectedMethod,
+        predicted_class: explained_class,
+        ...explanations[selectedMethod],
+      })
     } catch (error) {
       setError(error.response?.data?.detail || 'Error processing image')
       console.error('Analysis error:', error)
@@ -398,7 +398,7 @@ export default function ResultDisplay() {
             ) : (
               <>
                 <img
-                  src={`data:image/png;base64,${xaiResult.explanation_image_base64 || xaiResult.explanation_image || ''}`}
+                  src={`data:image/${xaiResult.image_format || 'png'};base64,${xaiResult.explanation_image_base64 || xaiResult.explanation_image || ''}`}
                   alt="XAI Explanation"
                   className="w-full rounded-lg shadow-lg"
                 />